@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+import itertools
+import numpy as np
+import pandas as pd
+
+# lines read and scored at once by scan_file_batch
+BATCH_LINES = 1 << 20
+
+
+def parse_urls(urls):
+    """
+    Vectorized parse_url over a pd.Series of urls, giving a frame with their
+    host, path, extension and main domain, and a mask of the urls parsed.
+
+    parse_url replaces every occurrence of the host and of "?query" in the
+    url, which only reduces to slicing the url when they occur once, at
+    their place. The urls that are not that simple (more than one "://",
+    "?" or "#", a "#" before the "?" or in the host, the host repeated later
+    in the url or a host without a dot, whose main domain does not exist)
+    are left out of the mask, for the caller to parse with parse_url.
+    """
+    urls = pd.Series(urls, dtype=str).reset_index(drop=True)
+
+    simple = (urls.str.count('://') <= 1).to_numpy(copy=True)
+    url = urls.str.partition('://')
+    url = url[2].where(url[1] != '', url[0])
+
+    host, slash, rest = (column for _, column in url.str.partition('/').items())
+    rest = slash + rest
+
+    question = rest.str.find('?').to_numpy()
+    sharp = rest.str.find('#').to_numpy()
+    simple &= (url.str.count(r'\?') <= 1).to_numpy() & (url.str.count('#') <= 1).to_numpy()
+    simple &= ~host.str.contains('?', regex=False).to_numpy()
+    simple &= ~host.str.contains('#', regex=False).to_numpy()
+    simple &= (sharp < 0) | (question < sharp)
+    simple &= host.str.contains('.', regex=False).to_numpy()
+    simple &= np.array([not host_name or host_name not in after
+                        for host_name, after in zip(host, rest)], dtype=bool)
+
+    # the path is the url without the host and without "?query"; the
+    # "#fragment" after the query stays in it
+    has_query = question >= 0
+    path = rest.where(~has_query, rest.str.partition('?')[0])
+    fragment = rest.str.partition('#')
+    path = path.where(~(has_query & (sharp >= 0)), path + fragment[1] + fragment[2])
+
+    extension = path.str.rpartition('.')
+    extension = extension[2].where(extension[1] != '', None)
+    main_domain = host.str.split('.').str[-2]
+
+    fields = pd.DataFrame({
+        'host': host,
+        'path': path,
+        'extension': extension,
+        'main_domain': main_domain,
+    })
+    return fields, simple
+
+
+def evaluate_batch(rules, fields, counts=None):
+    """
+    Evaluate a RuleSet over a frame of fields, in the order of the rules, each
+    rule only over the records no rule decided yet, and only once per
+    distinct value of its field. Rules whose predicate has no batch version
+    are evaluated value by value. Returns the verdicts and the ids of the
+    rules that gave them (None where no rule fired). counts is the number
+    of times each record stands for, added to the hits of the rules.
+    """
+    verdicts = np.full(len(fields), rules.default, dtype=np.int8)
+    fired = np.full(len(fields), None, dtype=object)
+    undecided = np.arange(len(fields))
+    field_names = {rule.rule_id: rule.field for rule in rules.rules}
+
+    for rule_id, field, predicate, verdict in rules.order:
+        if len(undecided) == 0:
+            break
+
+        column = fields[field_names[rule_id]].iloc[undecided]
+        codes, values = pd.factorize(column, use_na_sentinel=False)
+
+        batch = getattr(predicate, 'batch', None)
+        if batch is not None:
+            hits = np.asarray(batch(pd.Series(values)), dtype=bool)[codes]
+        else:
+            hits = np.array([bool(predicate(value)) for value in values], dtype=bool)[codes]
+
+        rows = undecided[hits]
+        verdicts[rows] = verdict
+        fired[rows] = rule_id
+        rules.hits[rule_id] += int(counts[rows].sum()) if counts is not None else len(rows)
+        undecided = undecided[~hits]
+
+    return verdicts, fired
+
+
+def scan_batch(scanner, urls):
+    """
+    Predictions of a UrlScanner for a whole list of urls, the same as
+    scan_url gives one by one. Returns the verdicts and the ids of the
+    rules that gave them.
+
+    Each distinct url is scored once, rescans of logs repeat a lot of them.
+    """
+    codes, urls = pd.factorize(pd.Series(urls, dtype=str))
+    if len(urls) == 0:
+        return np.zeros(0, dtype=np.int8), np.full(0, None, dtype=object)
+
+    fields, simple = parse_urls(urls)
+
+    verdicts = np.zeros(len(urls), dtype=np.int8)
+    fired = np.full(len(urls), None, dtype=object)
+
+    counts = np.bincount(codes, minlength=len(urls))
+
+    rows = np.flatnonzero(simple)
+    verdicts[rows], fired[rows] = evaluate_batch(scanner.rules, fields.iloc[rows], counts[rows])
+
+    # the others go through parse_url, one by one
+    for row in np.flatnonzero(~simple):
+        verdicts[row], fired[row] = scanner.explain(urls[row])
+        if fired[row] is not None:
+            scanner.rules.hits[fired[row]] += int(counts[row]) - 1
+
+    return verdicts[codes], fired[codes]
+
+
+def scan_file_batch(scanner, in_path, out_path, batch_lines=BATCH_LINES):
+    """
+    scan_file, batch_lines urls at a time through scan_batch. Returns the
+    number of scanned urls.
+    """
+    count = 0
+    with open(in_path, 'r') as urls_file, open(out_path, 'wb') as predictions_file:
+        while True:
+            urls = [url.rstrip() for url in itertools.islice(urls_file, batch_lines)]
+            if not urls:
+                break
+
+            # nothing after an empty line is scanned
+            stopped = '' in urls
+            if stopped:
+                urls = urls[:urls.index('')]
+
+            verdicts, _ = scan_batch(scanner, urls)
+            lines = np.full((len(verdicts), 2), ord('\n'), dtype=np.uint8)
+            lines[:, 0] = verdicts + ord('0')
+            predictions_file.write(lines.tobytes())
+            count += len(verdicts)
+
+            if stopped or len(urls) < batch_lines:
+                break
+
+    return count
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import tempfile
+import time
+
+# Hotfix to allow the shared preprocessing to be imported
+__import__('sys').path.append('..')
+
+from preprocessing.flow_csv import FlowCsvReader
+from my_av import TRAFFIC_FILE, dst_ip_field, flow_duration, flow_payload_avg, src_ip_field
+
+FIELDS = [flow_duration, flow_payload_avg, src_ip_field, dst_ip_field]
+
+
+def make_traffic(path, flows):
+    # the flows of the traffic file, repeated up to the given number
+    with open(TRAFFIC_FILE, 'r') as traffic_file:
+        header = traffic_file.readline()
+        packets = [packet for packet in traffic_file.read().splitlines() if packet]
+
+    with open(path, 'w') as out_file:
+        out_file.write(header)
+        for start in range(0, flows, len(packets)):
+            out_file.write(''.join(f"{packet}\n" for packet in packets[:flows - start]))
+
+
+def read_python(path):
+    # the fields of each flow, splitting each line once
+    count = 0
+    with open(path, 'r') as traffic_file:
+        traffic_file.readline()
+        for packet in traffic_file:
+            packet = packet.rstrip()
+            if not packet:
+                break
+            fields = packet.split(',')
+            values = [fields[field] for field in FIELDS]
+            count += 1
+    return count
+
+
+def read_mmap(path):
+    return sum(len(values[0]) for values in FlowCsvReader(path).iter_chunks(FIELDS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput of FlowCsvReader with splitting each line "
+                    "in python, extracting the fields the traffic scanner reads")
+    parser.add_argument('--flows', type=int, default=1_000_000,
+                        help="number of flows of the generated file")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs of each reader, the best one is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'traffic.in')
+        make_traffic(path, args.flows)
+
+        print(f"{'reader':<8} {'flows':>10} {'seconds':>8} {'flows/s':>12}")
+        for name, read in (('python', read_python), ('mmap', read_mmap)):
+            elapsed = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                count = read(path)
+                elapsed.append(time.perf_counter() - start)
+
+            best = min(elapsed)
+            print(f"{name:<8} {count:>10} {best:>8.3f} {count / best:>12.0f}")
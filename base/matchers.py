@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+
+import numpy as np
+
+from collections import deque
+from difflib import SequenceMatcher
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher built as an Aho-Corasick automaton.
+
+    The automaton is built once from the list of patterns and then answers
+    "does this text contain any of the patterns" in time proportional to the
+    length of the text, whatever the number of patterns.
+    """
+    def __init__(self, patterns):
+        # state 0 is the root, each state has a dict of transitions,
+        # a failure link and a flag telling if a pattern ends here
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [False]
+
+        for pattern in patterns:
+            self._add(pattern)
+        self._build_links()
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(False)
+            state = next_state
+        self.out[state] = True
+
+    def _build_links(self):
+        # breadth first, so the failure state of a node is always ready
+        # before we compute the ones of its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+
+                self.fail[next_state] = fail
+                # a suffix of this node is also a full pattern
+                self.out[next_state] = self.out[next_state] or self.out[fail]
+
+    def contains(self, text):
+        # an empty pattern is contained in every text
+        if self.out[0]:
+            return True
+
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                return True
+
+        return False
+
+    def __contains__(self, text):
+        return self.contains(text)
+
+
+def load_blacklist(path):
+    # load the list of known malicious hosts and strip newlines
+    with open(path, 'r') as f:
+        domains = [i.rstrip() for i in f.readlines()]
+
+    return AhoCorasick(domains)
+
+
+class TyposquatIndex:
+    """
+    Index over a whitelist of good domains that finds domains which look too
+    much like (but are not) one of them.
+
+    A domain is a typosquat if its SequenceMatcher ratio with a whitelisted
+    domain is above the threshold, or if it contains a whitelisted domain.
+    The ratio is 2 * M / T, where M is the number of matching chars and T the
+    total length of both strings. M can never be bigger than the shorter of
+    the two strings, nor than the number of chars they have in common, so
+    both give an upper bound of the ratio that is computed for the whole
+    whitelist at once. The exact ratio is computed only for the candidates
+    whose bound is above the threshold.
+    """
+    def __init__(self, whitelist, threshold=0.7):
+        self.whitelist = list(whitelist)
+        self.known = set(self.whitelist)
+        self.threshold = threshold
+
+        # whitelisted domains included in the hostname
+        self.substrings = AhoCorasick(self.whitelist)
+
+        # char histogram of each whitelisted domain
+        alphabet = sorted(set(''.join(self.whitelist)))
+        self.columns = {char: i for i, char in enumerate(alphabet)}
+        self.lengths = np.array([len(good) for good in self.whitelist],
+                                dtype=np.int64)
+        self.counts = np.zeros((len(self.whitelist), len(alphabet)),
+                               dtype=np.int64)
+        for i, good in enumerate(self.whitelist):
+            for char in good:
+                self.counts[i, self.columns[char]] += 1
+
+    def candidates(self, domain):
+        # indexes of the whitelisted domains that may be above the threshold
+        total = self.lengths + len(domain)
+        bound = 2.0 * np.minimum(self.lengths, len(domain)) / total
+        candidates = np.flatnonzero(bound > self.threshold)
+        if len(candidates) == 0:
+            return candidates
+
+        query = np.zeros(len(self.columns), dtype=np.int64)
+        for char in domain:
+            column = self.columns.get(char)
+            if column is not None:
+                query[column] += 1
+
+        common = np.minimum(self.counts[candidates], query).sum(axis=1)
+        bound = 2.0 * common / total[candidates]
+        return candidates[bound > self.threshold]
+
+    def is_typosquat(self, domain):
+        # a whitelisted domain is never a typosquat of itself
+        if domain in self.known:
+            return False
+
+        if self.substrings.contains(domain):
+            return True
+
+        for i in self.candidates(domain):
+            ratio = SequenceMatcher(None, self.whitelist[i], domain).ratio()
+            if ratio > self.threshold:
+                return True
+
+        return False
@@ -1,10 +1,48 @@
 #!/usr/bin/python3
 
-import re
-try:
-    from difflib import SequenceMatcher
-except Exception as e:
-    pass
+import argparse
+import itertools
+import os
+import time
+import numpy as np
+
+# Hotfix to allow the shared preprocessing to be imported
+__import__('sys').path.append('..')
+
+from preprocessing.durations import parse_time, parse_time_bytes
+from preprocessing.flow_csv import CHUNK_BYTES, FlowCsvReader
+from preprocessing.stages import Pipeline, Stage
+from matchers import TyposquatIndex, load_blacklist
+from batch import scan_file_batch
+from parallel import prediction_lines, scan_traffic_parallel, scan_urls_parallel
+from reputation import ReputationStore
+from rules import URL_FIELDS, RuleSet, url_rules
+
+# input and output files
+DOMAINS_DATABASE = "../data/url_dataset/domains_database"
+URLS_FILE = "../data/url_dataset/urls.in"
+URLS_PREDICTIONS = "urls-predictions.out"
+TRAFFIC_FILE = "../data/network_dataset/traffic.in"
+TRAFFIC_PREDICTIONS = "traffic-predictions.out"
+
+# some useful data
+whitelist = ['google', 'facebook', 'googlegroups', 'paypal', 'twitter', 'bing',
+             '123people', 'whatsapp', 'bdnews24']
+
+
+def read_chunks(file, chunk_size=1 << 20):
+    # yield the lines of a file, stripped, in chunks of about chunk_size
+    # bytes, until the first empty line
+    while True:
+        lines = [line.rstrip() for line in file.readlines(chunk_size)]
+        if not lines:
+            return
+
+        if '' in lines:
+            yield lines[:lines.index('')]
+            return
+        yield lines
+
 
 def parse_url(url):
     path, query, fragment = '', '', ''
@@ -27,197 +65,365 @@ def parse_url(url):
     return host, path, query, fragment
 
 
-def is_malicious(host, path):
-    # this function checks if the url contains any signs of malware
-
-    # check for common file extensions
-    if '.' in path:
-        extensions = ['exe', 'bin', 'sh', 'pl']
-        extension = path.split('.')[-1]
-        if extension in extensions:
-            return 1
-
-    main_domain = host.split('.')[-2]
-    # if known goood hosts, not malicious
-    if main_domain in whitelist:
-        return 0
-
-    # if hostname is too similar but not the same with a whitelisted domain,
-    # probbly malicious
-    for good_host in whitelist:
-        ratio = 0
-        try:
-            ratio = SequenceMatcher(None, good_host, main_domain).ratio()
-        except Exception:
-            pass
-        if ratio > 0.7:
-            return 1
-        # also if whitelisted domain is included in hostname
-        if good_host in main_domain and main_domain != good_host:
-            return 1
-
-    # if hostname is too long, may be malicious
-    if len(host) > 31:
-        return 1
-
-    # if too many numbers may be a malicious ip
-    no_numbers = 0
-    for char in charset:
-        if char in host:
-            no_numbers += 1
-    if no_numbers >= 0.1 * len(host):
-        return 1
-
-    # if connecting to a specific port or credentials, maybe malicious
-    if ':' in host or '@' in host:
-        return 1
-
-    # if double com extension may be a junk url ,so malicious
-    host = host + '/'
-    if len(re.findall(r"([^\w]+)com([^\w]+|/)", host)) > 1:
-        return 1
-    host = host[:-1]
-
-    # check for bad chars
-    if '~' in path and '.htm' not in path:
-        return 1
-
-    if 'secur' in path or 'paypal' in path or 'wp-admin' in path:
-        return 1
-
-    return 0
-
-
-# some useful data
-charset = "1234567890"
-whitelist = ['google', 'facebook', 'googlegroups', 'paypal', 'twitter', 'bing',
-             '123people', 'whatsapp', 'bdnews24']
-
-# load the list of known malicious hosts and strip newlines
-with open("../data/url_dataset/domains_database", 'r') as f:
-    malicious_domains = f.readlines()
-    malicious_domains = [i.rstrip() for i in malicious_domains]
-
-# now read the list of urls to analyze
-urls_file = open("../data/url_dataset/urls.in", 'r')
-predictions_file = open("urls-predictions.out", 'w')
-
-# for each url, analyze
-url = urls_file.readline().rstrip()
-while url != '' and url:
-    malicious = 0
-    host, path, query, fragment = parse_url(url)
-
-    # if host is known to be malicious, flag it
-    for mal_domain in malicious_domains:
-        if mal_domain in host:
-            malicious = 1
-
-    if is_malicious(host, path):
-        malicious = 1
-
-    # now output into the file
-    predictions_file.write(f"{malicious}\n")
-
-    # read each line and parse it
-    url = urls_file.readline().rstrip()
+class UrlScanner:
+    """
+    Scanner that flags malicious urls.
+
+    The blacklist matcher, the typosquat index and the rule table (rules.py)
+    are built once, then urls can be scanned one by one (scan_url), from any
+    iterable of lines (scan_iter) or from file objects and files, in
+    buffered chunks (scan_stream, scan_file). An empty line marks the end of
+    the input. explain gives the rule that decided the verdict of an url.
+    scan_pipeline overlaps the reading, parsing, scoring and writing of a
+    file in threads (preprocessing/stages.py).
+    """
+    def __init__(self, blacklist_path=DOMAINS_DATABASE, whitelist=whitelist):
+        self.blacklist = load_blacklist(blacklist_path)
+        self.whitelist = list(whitelist)
+        self.typosquats = TyposquatIndex(self.whitelist)
+        self.rules = RuleSet(url_rules(self.blacklist, self.whitelist, self.typosquats),
+                             URL_FIELDS)
+
+    def calibrate(self, urls):
+        # order the rules by their cost and hit rate on a sample of urls
+        return self.rules.calibrate(parse_url(url.rstrip())[:2] for url in urls if url.strip())
+
+    def explain(self, url):
+        # the verdict of the url and the id of the rule giving it
+        host, path, query, fragment = parse_url(url)
+        return self.rules.evaluate(host, path)
+
+    def is_malicious(self, host, path):
+        return self.rules.evaluate(host, path)[0]
+
+    def scan_url(self, url):
+        host, path, query, fragment = parse_url(url)
+        return self.rules.evaluate(host, path)[0]
+
+    def scan_iter(self, urls):
+        # yield the prediction of each url, until the first empty line
+        for url in urls:
+            url = url.rstrip()
+            if not url:
+                return
+            yield self.scan_url(url)
+
+    def scan_stream(self, urls_file, predictions_file, chunk_size=1 << 20):
+        # read about chunk_size bytes of lines at once and write all their
+        # predictions with a single call, so memory stays bounded; returns
+        # the number of scanned urls
+        count = 0
+        while True:
+            urls = urls_file.readlines(chunk_size)
+            if not urls:
+                break
+
+            predictions = [f"{malicious}\n" for malicious in self.scan_iter(urls)]
+            predictions_file.write(''.join(predictions))
+            count += len(predictions)
+
+            # stopped at an empty line
+            if len(predictions) < len(urls):
+                break
+
+        return count
+
+    def scan_file(self, in_path, out_path, chunk_size=1 << 20):
+        with open(in_path, 'r', buffering=chunk_size) as urls_file, \
+                open(out_path, 'w', buffering=chunk_size) as predictions_file:
+            return self.scan_stream(urls_file, predictions_file, chunk_size)
+
+    def scan_pipeline(self, in_path, out_path, chunk_size=1 << 20, maxsize=4):
+        # scan_file, with each step in its own thread; self.pipeline keeps
+        # the stats of the steps
+        count = 0
+
+        def score(records):
+            return [self.rules.evaluate(host, path)[0] for host, path in records]
+
+        def write(predictions):
+            nonlocal count
+            predictions_file.write(''.join(f"{malicious}\n" for malicious in predictions))
+            count += len(predictions)
+
+        with open(in_path, 'r', buffering=chunk_size) as urls_file, \
+                open(out_path, 'w', buffering=chunk_size) as predictions_file:
+            self.pipeline = Pipeline([
+                Stage('parse', lambda urls: [parse_url(url)[:2] for url in urls]),
+                Stage('score', score),
+                Stage('write', write),
+            ], maxsize)
+            self.pipeline.run(read_chunks(urls_file, chunk_size))
+
+        return count
 
-urls_file.close()
-predictions_file.close()
 
 # HERE STARTS TASK 2
 
-try:
-    import time
-    from datetime import timedelta
-except Exception as e:
-    pass
-
 # some macros for field numbers
 flow_duration = 4
 flow_payload_avg = 16
 src_ip_field = 0
 dst_ip_field = 2
 
+# the fields parse_traffic reads, in the order it returns them
+traffic_fields = [flow_duration, flow_payload_avg, src_ip_field, dst_ip_field]
+
 # cryptominers seem to have this info
 cryptominer_payload_avg = 40.0
 
-# this is the list with evil ips
-evil_ips = ['']
-
-
-def parse_time(duration):
-    days, duration = duration.split(' days ')
-    days = int(days) * 86400
-    try:
-        t_struct = time.strptime(duration, '%H:%M:%S.%f')
-        seconds = timedelta(hours=t_struct.tm_hour, minutes=t_struct.tm_min,
-                            seconds=t_struct.tm_sec).total_seconds()
-        miliseconds = 0
-        if '.' in duration:
-            miliseconds = float(f"0.{duration.split('.')[1]}")
-    except Exception as e:
-        return 0
-    # return total number of seconds
-    return float(days) + seconds + miliseconds
-
 
 def parse_traffic(packet):
     # get the fields we need for analyzing
-    duration = packet.split(',')[flow_duration]
-    payload_avg = packet.split(',')[flow_payload_avg]
-    src_ip = packet.split(',')[src_ip_field]
-    dst_ip = packet.split(',')[dst_ip_field]
+    fields = packet.split(',')
+    duration = fields[flow_duration]
+    payload_avg = fields[flow_payload_avg]
+    src_ip = fields[src_ip_field]
+    dst_ip = fields[dst_ip_field]
 
     return parse_time(duration), float(payload_avg), src_ip, dst_ip
 
 
-def is_malicious_traffic(packet):
-    duration, payload_avg, src_ip, dst_ip = parse_traffic(packet)
-
-    # if payload is 0, not malicious
-    if payload_avg == 0.0:
-        return 0
-
-    # if broadcast, not malicious
-    if '255.255.255.255' in dst_ip:
-        return 0
-
-    # check if IP is known to be bad
-    if src_ip in evil_ips:
-        return 1
-
-    # if duration is bigger than one second, probably malicious
-    if duration > 1.0:
-        evil_ips.append(src_ip)
-        return 1
-
-    if payload_avg == cryptominer_payload_avg:
-        evil_ips.append(src_ip)
-        return 1
-
-    return 0
-
-
-# now read the list of traffic packets to analyze
-traffic_file = open("../data/network_dataset/traffic.in", 'r')
-predictions_file = open("traffic-predictions.out", 'w')
-
-# first line is junk
-packet = traffic_file.readline()
-packet = traffic_file.readline().rstrip()
-
-while packet != '' and packet:
-    malicious = 0
-
-    if is_malicious_traffic(packet):
-        malicious = 1
-
-    # now output into the file
-    predictions_file.write(f"{malicious}\n")
-
-    # read each line and parse it
-    packet = traffic_file.readline().rstrip()
-
-traffic_file.close()
-predictions_file.close()
+class TrafficScanner:
+    """
+    Scanner that flags malicious network flows.
+
+    Each time a flow is found malicious, its source ip is remembered in the
+    evil_ips reputation store, so the following flows coming from the same ip
+    are flagged too. The input starts with a header line and an empty line
+    marks its end.
+
+    scan_file reads the memory mapped file with FlowCsvReader, copying out
+    only the four fields parse_traffic reads, and parses them a chunk of
+    flows at a time; only the flows that may be malicious go through
+    classify_fields, one by one, in order.
+    """
+    # the fields classify_chunk takes, read by scan_file and by the shards
+    # of a parallel scan
+    fields = traffic_fields
+
+    def __init__(self, evil_ips=None):
+        # this is the store with evil ips
+        self.evil_ips = ReputationStore() if evil_ips is None else evil_ips
+
+    def classify(self, packet):
+        # returns the verdict and, if the flow is not malicious by itself,
+        # the source ip that would make it malicious if known to be bad
+        return self.classify_fields(*parse_traffic(packet))
+
+    def classify_fields(self, duration, payload_avg, src_ip, dst_ip):
+        # classify, on the fields parse_traffic gives
+
+        # if payload is 0, not malicious
+        if payload_avg == 0.0:
+            return 0, None
+
+        # if broadcast, not malicious
+        if '255.255.255.255' in dst_ip:
+            return 0, None
+
+        # check if IP is known to be bad; a flow without a source ip always
+        # is, like it was when the evil ips started as ['']
+        if src_ip == '' or src_ip in self.evil_ips:
+            return 1, None
+
+        # if duration is bigger than one second, probably malicious
+        if duration > 1.0:
+            self.evil_ips.add(src_ip)
+            return 1, None
+
+        if payload_avg == cryptominer_payload_avg:
+            self.evil_ips.add(src_ip)
+            return 1, None
+
+        return 0, src_ip
+
+    def is_malicious(self, packet):
+        return self.classify(packet)[0]
+
+    def scan_iter(self, packets):
+        # yield the prediction of each packet, until the first empty line
+        for packet in packets:
+            packet = packet.rstrip()
+            if not packet:
+                return
+            yield self.is_malicious(packet)
+
+    def scan_stream(self, traffic_file, predictions_file, chunk_size=1 << 20):
+        count = 0
+        while True:
+            packets = traffic_file.readlines(chunk_size)
+            if not packets:
+                break
+
+            predictions = [f"{malicious}\n" for malicious in self.scan_iter(packets)]
+            predictions_file.write(''.join(predictions))
+            count += len(predictions)
+
+            # stopped at an empty line
+            if len(predictions) < len(packets):
+                break
+
+        return count
+
+    def classify_chunk(self, durations, payloads, src_ips, dst_ips):
+        # the verdicts of a chunk of flows, given as bytes arrays of the
+        # fields parse_traffic reads, and the rows of the benign flows that
+        # a known evil source ip would have made malicious
+        durations = parse_time_bytes(durations)
+        payloads = payloads.astype(np.float64)
+
+        # flows without payload or to the broadcast address are never
+        # malicious, and never teach an evil ip
+        candidates = (payloads != 0.0) & (np.char.find(dst_ips, b'255.255.255.255') < 0)
+
+        rows = np.flatnonzero(candidates)
+        results = [self.classify_fields(duration, payload, src_ip.decode(), dst_ip.decode())
+                   for duration, payload, src_ip, dst_ip
+                   in zip(durations[rows].tolist(), payloads[rows].tolist(),
+                          src_ips[rows].tolist(), dst_ips[rows].tolist())]
+
+        verdicts = np.zeros(len(payloads), dtype=np.uint8)
+        verdicts[rows] = [malicious for malicious, src_ip in results]
+        pending = rows[np.array([src_ip is not None for malicious, src_ip in results], dtype=bool)]
+        return verdicts, pending
+
+    def scan_file(self, in_path, out_path, chunk_size=CHUNK_BYTES):
+        count = 0
+        reader = FlowCsvReader(in_path, header=True, chunk_bytes=chunk_size)
+
+        with open(out_path, 'wb') as predictions_file:
+            for values in reader.iter_chunks(self.fields):
+                verdicts, pending = self.classify_chunk(*values)
+                predictions_file.write(prediction_lines(verdicts))
+                count += len(verdicts)
+
+        return count
+
+    def scan_pipeline(self, in_path, out_path, chunk_size=1 << 20, maxsize=4):
+        # scan_file, with each step in its own thread; the flows are still
+        # classified in order, since each one may teach an evil ip to the
+        # next ones
+        count = 0
+
+        def score(records):
+            return [self.classify_fields(*record)[0] for record in records]
+
+        def write(predictions):
+            nonlocal count
+            predictions_file.write(''.join(f"{malicious}\n" for malicious in predictions))
+            count += len(predictions)
+
+        with open(in_path, 'r', buffering=chunk_size) as traffic_file, \
+                open(out_path, 'w', buffering=chunk_size) as predictions_file:
+            # first line is junk
+            traffic_file.readline()
+
+            self.pipeline = Pipeline([
+                Stage('parse', lambda packets: [parse_traffic(packet) for packet in packets]),
+                Stage('score', score),
+                Stage('write', write),
+            ], maxsize)
+            self.pipeline.run(read_chunks(traffic_file, chunk_size))
+
+        return count
+
+
+def run(workers=1, evil_ips=None, calibrate=0, batch=False, pipeline=False):
+    # run both tasks and return the number of scanned records and the time
+    # spent by each of them; with pipeline, also print the stats of the
+    # steps of each scan
+    stats = []
+    url_scanner = UrlScanner()
+    traffic_scanner = TrafficScanner(evil_ips)
+
+    start = time.perf_counter()
+    if calibrate:
+        with open(URLS_FILE, 'r') as urls_file:
+            url_scanner.calibrate(itertools.islice(urls_file, calibrate))
+    if batch:
+        count = scan_file_batch(url_scanner, URLS_FILE, URLS_PREDICTIONS)
+    elif workers > 1:
+        count = scan_urls_parallel(url_scanner, URLS_FILE, URLS_PREDICTIONS, workers)
+    elif pipeline:
+        count = url_scanner.scan_pipeline(URLS_FILE, URLS_PREDICTIONS)
+        print(f"urls\n{url_scanner.pipeline.report()}\n")
+    else:
+        count = url_scanner.scan_file(URLS_FILE, URLS_PREDICTIONS)
+    stats.append(('urls', count, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    if workers > 1:
+        count = scan_traffic_parallel(traffic_scanner, TRAFFIC_FILE,
+                                      TRAFFIC_PREDICTIONS, workers)
+    elif pipeline:
+        count = traffic_scanner.scan_pipeline(TRAFFIC_FILE, TRAFFIC_PREDICTIONS)
+        print(f"traffic\n{traffic_scanner.pipeline.report()}\n")
+    else:
+        count = traffic_scanner.scan_file(TRAFFIC_FILE, TRAFFIC_PREDICTIONS)
+    stats.append(('traffic', count, time.perf_counter() - start))
+
+    return stats
+
+
+def report_scaling(max_workers):
+    # run with 1, 2, 4, ... up to max_workers processes and print the
+    # throughput of each pass together with the speedup over a single core
+    workers = [1]
+    while workers[-1] * 2 < max_workers:
+        workers.append(workers[-1] * 2)
+    if max_workers > 1:
+        workers.append(max_workers)
+
+    baseline = {}
+    print(f"{'pass':<8} {'workers':>7} {'records':>10} {'seconds':>8} "
+          f"{'records/s':>12} {'speedup':>7}")
+    for n in workers:
+        for name, count, elapsed in run(n):
+            throughput = count / elapsed if elapsed else float('inf')
+            baseline.setdefault(name, throughput)
+            print(f"{name:<8} {n:>7} {count:>10} {elapsed:>8.3f} "
+                  f"{throughput:>12.0f} {throughput / baseline[name]:>6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan urls and network traffic")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes the input files are sharded across")
+    parser.add_argument('--scaling', action='store_true',
+                        help="report the throughput from 1 to --workers processes")
+    parser.add_argument('--calibrate', type=int, default=0, metavar='N',
+                        help="order the url rules by their cost and hit rate on the first N urls")
+    parser.add_argument('--batch', action='store_true',
+                        help="score the urls in large vectorized batches")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="read, parse, score and write in overlapping threads "
+                             "and print how busy each step was")
+    parser.add_argument('--ip-ttl', type=float, default=None,
+                        help="seconds an evil ip is remembered for")
+    parser.add_argument('--ip-max-size', type=int, default=None,
+                        help="maximum number of evil ips remembered")
+    parser.add_argument('--ip-snapshot', default=None,
+                        help="file the evil ips are restored from and saved to")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and (args.ip_ttl is not None or args.ip_max_size is not None):
+        parser.error("--ip-ttl and --ip-max-size need a sequential scan (--workers 1)")
+    if args.workers > 1 and args.pipeline:
+        parser.error("--pipeline needs a single process (--workers 1)")
+    if args.batch and (args.workers > 1 or args.pipeline):
+        parser.error("--batch scores the urls on its own, without --workers or --pipeline")
+
+    evil_ips = ReputationStore(ttl=args.ip_ttl, max_size=args.ip_max_size)
+    if args.ip_snapshot and os.path.exists(args.ip_snapshot):
+        evil_ips.restore(args.ip_snapshot)
+
+    if args.scaling:
+        report_scaling(args.workers)
+    else:
+        run(args.workers, evil_ips, args.calibrate, args.batch, args.pipeline)
+
+    if args.ip_snapshot:
+        evil_ips.snapshot(args.ip_snapshot)
@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+
+import copy
+import locale
+import os
+import numpy as np
+
+# Hotfix to allow the shared preprocessing to be imported
+__import__('sys').path.append('..')
+
+from multiprocessing import Pool
+from preprocessing.flow_csv import CHUNK_BYTES, FlowCsvReader
+from reputation import ip_key, key_ip
+
+# scanner copied into each worker process by the pool initializer
+worker_scanner = None
+
+# bytes of the traffic file scanned by each task; the results of the tasks
+# are merged and written as they finish, so the parent only holds a few
+SHARD_BYTES = 4 * CHUNK_BYTES
+
+
+def shard_ranges(path, shards, offset=0):
+    # split the file, from offset to its end, into byte ranges of about the
+    # same size, each one starting at the beginning of a line
+    size = os.path.getsize(path)
+    bounds = [offset]
+
+    with open(path, 'rb') as f:
+        for i in range(1, shards):
+            position = offset + (size - offset) * i // shards
+            if position <= bounds[-1]:
+                continue
+            # move to the start of the next line
+            f.seek(position - 1)
+            f.readline()
+            position = f.tell()
+            if bounds[-1] < position < size:
+                bounds.append(position)
+
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def header_size(path):
+    with open(path, 'rb') as f:
+        return len(f.readline())
+
+
+def read_range(path, begin, end):
+    # yield the lines between the two offsets of the file
+    encoding = locale.getpreferredencoding(False)
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        position = begin
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode(encoding)
+
+
+def init_worker(scanner):
+    global worker_scanner
+    worker_scanner = scanner
+
+
+def scan_url_range(task):
+    # returns the predictions of the range and if an empty line was found
+    path, begin, end = task
+    predictions = bytearray()
+
+    for url in read_range(path, begin, end):
+        url = url.rstrip()
+        if not url:
+            return predictions, True
+        predictions += b'1\n' if worker_scanner.scan_url(url) else b'0\n'
+
+    return predictions, False
+
+
+def prediction_lines(verdicts):
+    # the lines of the predictions file for a uint8 array of verdicts
+    lines = np.full((len(verdicts), 2), ord('\n'), dtype=np.uint8)
+    lines[:, 0] = verdicts + ord('0')
+    return lines.tobytes()
+
+
+def scan_traffic_range(task):
+    # each range starts from the evil ips known before the scan. Besides the
+    # verdicts, return the ips learned in this range, the hits of the ips
+    # known before, the lines that would have been malicious if their source
+    # ip was already known and these source ips, and if an empty line was
+    # found
+    path, begin, end = task
+    scanner = copy.deepcopy(worker_scanner)
+    known = {key: hits for key, (expires, hits) in scanner.evil_ips.entries.items()}
+
+    reader = FlowCsvReader(path, header=False)
+    verdicts, lines, ips = [], [], []
+    count = 0
+
+    for durations, payloads, src_ips, dst_ips in reader.iter_chunks(scanner.fields, begin, end):
+        chunk_verdicts, pending = scanner.classify_chunk(durations, payloads, src_ips, dst_ips)
+        verdicts.append(chunk_verdicts)
+        lines.append(pending + count)
+        ips.append(src_ips[pending])
+        count += len(chunk_verdicts)
+
+    learned = [key for key in scanner.evil_ips.entries if key not in known]
+    hits = {key: entry[1] - known.get(key, 0)
+            for key, entry in scanner.evil_ips.entries.items()}
+
+    verdicts = np.concatenate(verdicts) if verdicts else np.zeros(0, dtype=np.uint8)
+    lines = np.concatenate(lines) if lines else np.zeros(0, dtype=np.intp)
+    ips = np.concatenate(ips) if ips else np.zeros(0, dtype='S1')
+    return verdicts, learned, hits, lines, ips, reader.stopped
+
+
+def run_sharded(function, scanner, tasks, workers):
+    # yield the results of the tasks in their order, as they finish
+    with Pool(workers, initializer=init_worker, initargs=(scanner,)) as pool:
+        yield from pool.imap(function, tasks)
+
+
+def scan_urls_parallel(scanner, in_path, out_path, workers):
+    """
+    Scan the urls file with a pool of processes, each one scanning a range of
+    the file, and write the predictions in input order. Returns the number of
+    scanned urls.
+    """
+    tasks = [(in_path, begin, end)
+             for begin, end in shard_ranges(in_path, workers)]
+    results = run_sharded(scan_url_range, scanner, tasks, workers)
+
+    count = 0
+    with open(out_path, 'wb') as predictions_file:
+        for predictions, stopped in results:
+            predictions_file.write(predictions)
+            count += len(predictions) // 2
+            # nothing after an empty line is scanned
+            if stopped:
+                break
+
+    return count
+
+
+def scan_traffic_parallel(scanner, in_path, out_path, workers):
+    """
+    Scan the traffic file with a pool of processes, each one scanning a range
+    of the file, and write the predictions in input order. Returns the number
+    of scanned packets.
+
+    The file is split into ranges of about SHARD_BYTES bytes, at least one
+    per worker, each one read memory mapped and classified a chunk at a time
+    like scan_file does; the results of the ranges are merged and written
+    in order as they finish.
+
+    Each range is scanned knowing only the evil ips of the scanner and the
+    ones it learns itself. The results are then merged in input order: a flow
+    that was left benign only because its source ip was not known yet is
+    flagged if the ip was learned in any of the previous ranges, and the ips
+    learned by each range are added to the scanner's ones in input order.
+    This gives exactly the predictions of a sequential scan, which is why
+    evil ips cannot expire nor be evicted while scanning in parallel.
+    """
+    if scanner.evil_ips.ttl is not None or scanner.evil_ips.max_size is not None:
+        raise ValueError("Evil ips eviction needs a sequential scan")
+
+    offset = header_size(in_path)
+    shards = max(workers, (os.path.getsize(in_path) - offset) // SHARD_BYTES)
+    tasks = [(in_path, begin, end)
+             for begin, end in shard_ranges(in_path, shards, offset)]
+    results = run_sharded(scan_traffic_range, scanner, tasks, workers)
+
+    learned = set()
+    count = 0
+    with open(out_path, 'wb') as predictions_file:
+        for verdicts, evil_ips, hits, lines, ips, stopped in results:
+            # each distinct pending source ip is looked up once
+            if learned and len(lines):
+                ips, codes = np.unique(ips, return_inverse=True)
+                ips = ips.astype(str).tolist()
+                flagged = np.array([ip_key(ip) in learned for ip in ips], dtype=bool)
+                verdicts[lines[flagged[codes]]] = 1
+
+                counts = np.bincount(codes, minlength=len(ips))
+                for i in np.flatnonzero(flagged):
+                    scanner.evil_ips.add_hits(ips[i], int(counts[i]))
+
+            for key in evil_ips:
+                if key in learned:
+                    # a sequential scan would have found it already known
+                    scanner.evil_ips.add_hits(key_ip(key), 1)
+                else:
+                    learned.add(key)
+                    scanner.evil_ips.add(key_ip(key))
+
+            for key, extra_hits in hits.items():
+                scanner.evil_ips.add_hits(key_ip(key), extra_hits)
+
+            predictions_file.write(prediction_lines(verdicts))
+            count += len(verdicts)
+            if stopped:
+                break
+
+    return count
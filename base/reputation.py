@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+
+import heapq
+import ipaddress
+import json
+import os
+import socket
+import time
+
+from collections import OrderedDict
+
+SNAPSHOT_VERSION = 1
+
+
+def ip_key(ip):
+    # pack the address into an int; IPv6 keys get bit 128 set so they never
+    # collide with IPv4 ones. Anything that is not an ip is kept as a string
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, ValueError):
+        pass
+
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big') | (1 << 128)
+    except (OSError, ValueError):
+        return ip
+
+
+def key_ip(key):
+    if isinstance(key, str):
+        return key
+    if key >> 128:
+        return str(ipaddress.IPv6Address(key & ((1 << 128) - 1)))
+    return str(ipaddress.IPv4Address(key))
+
+
+class ReputationStore:
+    """
+    Store of the ips known to be evil, with constant time lookups.
+
+    Parameters:
+    - ttl: seconds an ip is remembered after it was added, None to keep it forever
+    - max_size: maximum number of ips, the least recently seen is evicted
+      first; None for no limit
+    - clock: function returning the current time in seconds
+
+    Each entry keeps the time it expires at and the number of times it was
+    looked up successfully (hits). The expiry times are also kept in a heap,
+    from which add drops the expired entries, so with a ttl the store never
+    holds more than the ips added during the last ttl seconds.
+    """
+    def __init__(self, ttl=None, max_size=None, clock=time.time):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.entries = OrderedDict()
+
+        # (expires, sequence, key) of the entries, the sequence breaking the
+        # ties between int and str keys; an item is stale once its entry was
+        # added again, with a later expiry, or removed
+        self._expiries = []
+        self._sequence = 0
+
+    def add(self, ip):
+        key = ip_key(ip)
+        now = self.clock()
+        expires = None if self.ttl is None else now + self.ttl
+        hits = self.entries[key][1] if key in self.entries else 0
+
+        self.entries[key] = [expires, hits]
+        self.entries.move_to_end(key)
+        self._push_expiry(key, expires)
+        self._purge(now)
+
+        if self.max_size is not None:
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, ip):
+        key = ip_key(ip)
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+
+        if entry[0] is not None and entry[0] <= self.clock():
+            del self.entries[key]
+            return False
+
+        entry[1] += 1
+        self.entries.move_to_end(key)
+        return True
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        # ips from the least to the most recently seen
+        return (key_ip(key) for key in self.entries)
+
+    def hits(self, ip):
+        entry = self.entries.get(ip_key(ip))
+        return entry[1] if entry else 0
+
+    def add_hits(self, ip, count):
+        entry = self.entries.get(ip_key(ip))
+        if entry:
+            entry[1] += count
+
+    def evict_expired(self):
+        return self._purge(self.clock())
+
+    def _push_expiry(self, key, expires):
+        if expires is not None:
+            heapq.heappush(self._expiries, (expires, self._sequence, key))
+            self._sequence += 1
+
+    def _purge(self, now):
+        # drop the entries expired at now, returning how many there were
+        purged = 0
+        while self._expiries and self._expiries[0][0] <= now:
+            expires, sequence, key = heapq.heappop(self._expiries)
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == expires:
+                del self.entries[key]
+                purged += 1
+        return purged
+
+    def snapshot(self, path):
+        # write the store to disk; the file is replaced atomically, so a crash
+        # never leaves a half written snapshot behind
+        self.evict_expired()
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'ttl': self.ttl,
+            'max_size': self.max_size,
+            'entries': [[key_ip(key), expires, hits]
+                        for key, (expires, hits) in self.entries.items()],
+        }
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def restore(self, path):
+        # load the entries of a snapshot, dropping the ones expired meanwhile
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {data.get('version')}")
+
+        now = self.clock()
+        for ip, expires, hits in data['entries']:
+            if expires is not None and expires <= now:
+                continue
+            key = ip_key(ip)
+            self.entries[key] = [expires, hits]
+            self.entries.move_to_end(key)
+            self._push_expiry(key, expires)
+
+        if self.max_size is not None:
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
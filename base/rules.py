@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+
+import re
+import time
+import numpy as np
+
+from collections import namedtuple
+
+# a rule fires when predicate(value of the field) is true, giving its verdict
+Rule = namedtuple('Rule', ['rule_id', 'field', 'predicate', 'verdict'])
+
+BAD_EXTENSIONS = ['exe', 'bin', 'sh', 'pl']
+DIGITS = frozenset("1234567890")
+DOUBLE_COM = re.compile(r"([^\w]+)com([^\w]+|/)")
+PATH_KEYWORDS = re.compile('|'.join(map(re.escape, ['secur', 'paypal', 'wp-admin'])))
+
+
+def url_host(host, path):
+    return host
+
+
+def url_path(host, path):
+    return path
+
+
+def url_extension(host, path):
+    return path.split('.')[-1] if '.' in path else None
+
+
+def url_main_domain(host, path):
+    return host.split('.')[-2]
+
+
+# fields of an url the rules look at, computed from its host and path
+URL_FIELDS = {
+    'host': url_host,
+    'path': url_path,
+    'extension': url_extension,
+    'main_domain': url_main_domain,
+}
+
+
+# the predicates are callables on one value, with a batch method doing the
+# same over a whole pd.Series of values, returning a boolean array, used by
+# the batch scan (batch.py). They are classes, not closures, so a scanner
+# can be pickled to the worker processes (parallel.py)
+
+class IsIn:
+    def __init__(self, values):
+        self.values = frozenset(values)
+
+    def __call__(self, value):
+        return value in self.values
+
+    def batch(self, column):
+        return column.isin(self.values).to_numpy()
+
+
+class LongerThan:
+    def __init__(self, length):
+        self.length = length
+
+    def __call__(self, value):
+        return len(value) > self.length
+
+    def batch(self, column):
+        return (column.str.len() > self.length).to_numpy()
+
+
+class ManyDigits:
+    # the number of distinct digits, compared to the length
+    def __init__(self, ratio):
+        self.ratio = ratio
+
+    def __call__(self, value):
+        return len(DIGITS.intersection(value)) >= self.ratio * len(value)
+
+    def batch(self, column):
+        distinct = sum(column.str.contains(digit, regex=False).to_numpy(dtype=int)
+                       for digit in sorted(DIGITS))
+        return distinct >= self.ratio * column.str.len().to_numpy()
+
+
+class ContainsAny:
+    def __init__(self, *chars):
+        self.chars = chars
+
+    def __call__(self, value):
+        return any(char in value for char in self.chars)
+
+    def batch(self, column):
+        return np.logical_or.reduce([column.str.contains(char, regex=False).to_numpy()
+                                     for char in self.chars])
+
+
+class MatchesMoreThan:
+    def __init__(self, pattern, times, suffix=''):
+        self.pattern = pattern
+        self.times = times
+        self.suffix = suffix
+
+    def __call__(self, value):
+        return len(self.pattern.findall(value + self.suffix)) > self.times
+
+    def batch(self, column):
+        return ((column + self.suffix).str.count(self.pattern) > self.times).to_numpy()
+
+
+class Searches:
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def __call__(self, value):
+        return self.pattern.search(value) is not None
+
+    def batch(self, column):
+        return column.str.contains(self.pattern).to_numpy()
+
+
+class TildeNotHtml:
+    def __call__(self, path):
+        return '~' in path and '.htm' not in path
+
+    def batch(self, column):
+        return (column.str.contains('~', regex=False)
+                & ~column.str.contains('.htm', regex=False)).to_numpy()
+
+
+def url_rules(blacklist, whitelist, typosquats):
+    """
+    The heuristics flagging malicious urls, in the order they apply: the
+    first rule that fires gives the verdict, 0 if none does.
+    """
+    return [
+        # the host is known to be malicious
+        Rule('blacklisted-host', 'host', blacklist.contains, 1),
+        # common executable file extensions
+        Rule('bad-extension', 'extension', IsIn(BAD_EXTENSIONS), 1),
+        # known good hosts are not malicious
+        Rule('whitelisted-domain', 'main_domain', IsIn(whitelist), 0),
+        # too similar but not the same with a whitelisted domain, or
+        # including one
+        Rule('typosquat', 'main_domain', typosquats.is_typosquat, 1),
+        Rule('long-host', 'host', LongerThan(31), 1),
+        # too many numbers may be a malicious ip
+        Rule('many-digits', 'host', ManyDigits(0.1), 1),
+        # connecting to a specific port or with credentials
+        Rule('port-or-credentials', 'host', ContainsAny(':', '@'), 1),
+        # double com extension may be a junk url
+        Rule('double-com', 'host', MatchesMoreThan(DOUBLE_COM, 1, '/'), 1),
+        Rule('tilde-path', 'path', TildeNotHtml(), 1),
+        Rule('path-keyword', 'path', Searches(PATH_KEYWORDS), 1),
+    ]
+
+
+class RuleSet:
+    """
+    Rule table compiled for evaluation.
+
+    Rules are evaluated in order and short-circuit at the first one that
+    fires. Consecutive rules with the same verdict form a tier: which of them
+    fires first never changes the verdict, so the rules of a tier can be
+    reordered by calibrate, cheapest and most often firing first, while the
+    tiers keep the order of the table.
+
+    hits counts how many times each rule fired.
+    """
+    def __init__(self, rules, fields, default=0):
+        self.rules = list(rules)
+        self.fields = fields
+        self.default = default
+        self.hits = {rule.rule_id: 0 for rule in self.rules}
+
+        self.tiers = []
+        for rule in self.rules:
+            if not self.tiers or self.tiers[-1][0].verdict != rule.verdict:
+                self.tiers.append([])
+            self.tiers[-1].append(rule)
+        self._compile()
+
+    def _compile(self):
+        # flatten the tiers into (rule id, field getter, predicate, verdict)
+        self.order = [(rule.rule_id, self.fields[rule.field], rule.predicate, rule.verdict)
+                      for tier in self.tiers for rule in tier]
+
+    def evaluate(self, *record):
+        # return the verdict and the id of the rule that gave it, None if
+        # no rule fired
+        for rule_id, field, predicate, verdict in self.order:
+            if predicate(field(*record)):
+                self.hits[rule_id] += 1
+                return verdict, rule_id
+
+        return self.default, None
+
+    def calibrate(self, records):
+        """
+        Reorder the rules of each tier by increasing cost / hit rate, both
+        measured on the records reaching the tier, which minimizes the
+        expected time spent in it. Returns the measures of each rule, as
+        {rule_id: (seconds per record, hit rate)}.
+        """
+        measures = {}
+        records = list(records)
+
+        for tier in self.tiers:
+            fired = [False] * len(records)
+            failed = [False] * len(records)
+
+            for rule in tier:
+                field = self.fields[rule.field]
+                hits = 0
+                start = time.perf_counter()
+                for i, record in enumerate(records):
+                    try:
+                        if rule.predicate(field(*record)):
+                            fired[i] = True
+                            hits += 1
+                    except Exception:
+                        failed[i] = True
+                elapsed = time.perf_counter() - start
+
+                count = max(len(records), 1)
+                measures[rule.rule_id] = (elapsed / count, hits / count)
+
+            # cheap rules that fire often first; a rule that never fired
+            # goes last, by cost
+            tier.sort(key=lambda rule: (measures[rule.rule_id][1] == 0,
+                                        measures[rule.rule_id][0] / (measures[rule.rule_id][1] or 1)))
+
+            # records decided here, or failing here, never reach the next tier
+            records = [record for i, record in enumerate(records)
+                       if not fired[i] and not failed[i]]
+
+        self._compile()
+        return measures
@@ -1,7 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Dict
 from math import log2
 from pandas import DataFrame
 import numpy as np
+import os
+
+from preprocessing.serialization import load_arrays, save_arrays
 
 
 def shannon_entropy(probabilities: List[float]) -> float:
@@ -18,10 +22,23 @@ def gini_impurity(probabilities: List[float]) -> float:
     return 1 - sum(p ** 2 for p in probabilities)
 
 
+def histogram_entropy(counts: np.ndarray) -> np.ndarray:
+    """
+    Calculate the Shannon entropy of each row of a matrix of class counts.
+    """
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = counts / totals
+        terms = np.where(counts > 0, probabilities * np.log2(probabilities), 0)
+    return -terms.sum(axis=-1)
+
+
 class DecisionTreeNode():
     """
     A node in the decision tree.
     """
+    __slots__ = ('entropy', 'column', 'split_value', 'probs', 'prediction', 'left', 'right')
+
     def __init__(self) -> None:
         self.entropy: float = None
         self.column: int = None
@@ -39,122 +56,365 @@ class DecisionTree():
     Parameters:
     - max_depth: The maximum depth of the tree.
     - min_info_gain: The minimum information gain required to split a node.
+    - max_bins: The maximum number of thresholds tried on each feature. None
+      tries every distinct value, otherwise the values are grouped into
+      quantile bins and only the bin edges are tried.
+    - n_jobs: The number of threads evaluating the splits of the features of
+      a node in parallel, -1 for one per CPU. The NumPy kernels of the split
+      search release the GIL; the results are combined in feature order, so
+      the tree does not depend on n_jobs.
+    - max_features: The number of features, drawn at random, whose splits are
+      evaluated at each node: an int, a fraction of the features, 'sqrt' or
+      None for all of them.
+    - random_state: The seed used to draw the features of each node.
+
+    Each feature is binned once, before building the tree. The split search
+    of a node then counts the classes in each bin and evaluates every
+    threshold of the feature in a single cumulative sweep over the bins.
+
+    Once built, the tree is also compiled into arrays indexed by node, the
+    root being node 0, which is what predictions use:
+    - feature_, threshold_: the split of each node, x[feature] <= threshold
+      going to the left child
+    - left_, right_: the children of each node, -1 where there is none
+    - value_: the class distribution of the samples of each node
+
+    save and load (see preprocessing/serialization.py) only keep these
+    arrays, memory mapped on load: a loaded tree predicts, but has no
+    DecisionTreeNode tree.
     """
-    def __init__(self, max_depth: int = 5, min_info_gain: float = 0.1) -> None:
+    def __init__(
+            self,
+            max_depth: int = 5,
+            min_info_gain: float = 0.1,
+            max_bins: int = None,
+            n_jobs: int = 1,
+            max_features: int | float | str = None,
+            random_state: int = None
+        ) -> None:
         self.tree: DecisionTreeNode = None
         self.max_depth = max_depth
         self.min_info_gain = min_info_gain
+        self.max_bins = max_bins
+        self.n_jobs = n_jobs
+        self.max_features = max_features
+        self.random_state = random_state
+
+        self.classes_: np.ndarray = None
+        self.thresholds_: List[np.ndarray] = None
+
+        self.feature_: np.ndarray = None
+        self.threshold_: np.ndarray = None
+        self.left_: np.ndarray = None
+        self.right_: np.ndarray = None
+        self.value_: np.ndarray = None
+        self._children: np.ndarray = None
+        self._depth = 0
+        self._executor: ThreadPoolExecutor = None
+        self._rng: np.random.Generator = None
+        self._n_features: int = None
 
     def fit(self, X: np.ndarray | DataFrame, y: np.ndarray) -> None:
         """
         Fit the decision tree to the data.
         """
         X = X.to_numpy() if isinstance(X, DataFrame) else X
-        self.tree = self._build_tree(X, y, 0)
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) != len(y):
+            raise ValueError(f"X has {len(X)} rows but y has {len(y)} labels")
+
+        # Work on class indices and on the bins of the features
+        self.classes_, y = np.unique(y, return_inverse=True)
+        bins = self._bin(X)
+
+        self._rng = np.random.default_rng(self.random_state)
+        self._n_features = self._features_per_node(X.shape[1])
+
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        if n_jobs is not None and n_jobs > 1:
+            # never leave a shut down executor behind, even if building fails
+            try:
+                with ThreadPoolExecutor(n_jobs) as self._executor:
+                    self.tree = self._build_tree(bins, y)
+            finally:
+                self._executor = None
+        else:
+            self.tree = self._build_tree(bins, y)
+
+        self._compile()
 
     def predict(self, X: np.ndarray | DataFrame) -> np.ndarray:
         X = X.to_numpy() if isinstance(X, DataFrame) else X
 
-        if self.tree is None:
+        if self.feature_ is None:
             raise ValueError("Tree not fitted")
-        
+        if len(self.feature_) == 0:
+            raise ValueError("Tree has no nodes, max_depth must be at least 1")
+
         if len(X.shape) == 1:
-            return self._predict_one(X)
+            return self.predict(X.reshape(1, -1))[0]
 
-        return np.array([self._predict_one(x) for x in X])
+        nodes = self._apply(X)
+        return self.classes_[np.argmax(self.value_, axis=1)][nodes]
 
-    def _entropy(self, data: np.ndarray) -> float:
-        probabilities = [np.mean(data == c) for c in np.unique(data)]
-        return shannon_entropy(probabilities)
-    
-    def _partition_entropy(self, subsets: List[np.ndarray]) -> float:
-        total_count = sum(len(subset) for subset in subsets)
-        return sum(len(subset) / total_count * self._entropy(subset) for subset in subsets)
-    
-    def _split(self, X: np.ndarray, y: np.ndarray, column: int, value: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-        column_values = X[:, column]
-        mask = column_values <= value
-        left_X, right_X = X[mask], X[~mask]
-        left_y, right_y = y[mask], y[~mask]
+    def predict_proba(self, X: np.ndarray | DataFrame) -> np.ndarray:
+        """
+        Predict the probability of each class in classes_, as the class
+        distribution of the training samples of the node reached.
+        """
+        X = X.to_numpy() if isinstance(X, DataFrame) else X
 
-        return left_X, right_X, left_y, right_y
-    
-    def _best_column_split(self, X: np.ndarray, y: np.ndarray, column: int) -> Tuple[float, float]:
-        min_entropy = float('inf')
-        best_value = None
+        if self.feature_ is None:
+            raise ValueError("Tree not fitted")
+        if len(self.feature_) == 0:
+            raise ValueError("Tree has no nodes, max_depth must be at least 1")
 
-        # Simplified best split search
-        unique_values = np.unique(X[:, column])
-        sorted_values = np.sort(unique_values)
+        if len(X.shape) == 1:
+            return self.predict_proba(X.reshape(1, -1))[0]
 
-        max_splits = 20
-        step = max(len(sorted_values) // max_splits, 1)
+        return self.value_[self._apply(X)]
 
-        for i in range(0, len(sorted_values), step):
-            value = sorted_values[i]
-            _, _, left_y, right_y = self._split(X, y, column, value)
-            entropy = self._partition_entropy([left_y, right_y])
+    def save(self, path: str) -> None:
+        """
+        Save the compiled tree into the directory path.
+        """
+        if self.feature_ is None:
+            raise ValueError("Tree not fitted")
 
-            if entropy < min_entropy:
-                min_entropy = entropy
-                best_value = value
+        params = {
+            'max_depth': self.max_depth,
+            'min_info_gain': self.min_info_gain,
+            'max_bins': self.max_bins,
+            'n_jobs': self.n_jobs,
+            'max_features': self.max_features,
+            'random_state': self.random_state,
+            'depth': self._depth,
+        }
+        arrays = {
+            'classes_': self.classes_,
+            'feature_': self.feature_,
+            'threshold_': self.threshold_,
+            'left_': self.left_,
+            'right_': self.right_,
+            'value_': self.value_,
+        }
+        save_arrays(path, 'DecisionTree', params, arrays)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> "DecisionTree":
+        """
+        Load a tree saved with save. With mmap_mode='r' the arrays are
+        read-only memory maps of the files, None reads them into memory.
+        """
+        params, arrays = load_arrays(path, 'DecisionTree', mmap_mode)
+        depth = params.pop('depth')
+
+        tree = cls(**params)
+        for name, array in arrays.items():
+            setattr(tree, name, array)
+        tree._depth = depth
+        tree._link()
+        return tree
+
+    def _bin(self, X: np.ndarray) -> np.ndarray:
+        """
+        Replace each value by the index of the smallest threshold of its
+        feature that is greater or equal to it, so that x <= thresholds[i]
+        exactly when bin(x) <= i.
+        """
+        self.thresholds_ = []
+        # column major, nodes gather one column at a time
+        bins = np.empty(X.shape, dtype=np.int32, order='F')
+
+        for column in range(X.shape[1]):
+            values = X[:, column]
+            thresholds = np.unique(values)
+
+            if self.max_bins is not None and len(thresholds) > self.max_bins:
+                quantiles = np.linspace(0, 1, self.max_bins + 1)[1:]
+                thresholds = np.unique(np.quantile(values, quantiles, method='lower'))
 
-        return best_value, min_entropy
+            self.thresholds_.append(thresholds)
+            bins[:, column] = np.searchsorted(thresholds, values)
 
-    def _best_split(self, X: np.ndarray, y: np.ndarray) -> Tuple[int, float, float]:
+        return bins
+
+    def _features_per_node(self, n_features: int) -> int:
+        if self.max_features is None:
+            return n_features
+        if self.max_features == 'sqrt':
+            return max(1, int(np.sqrt(n_features)))
+        if isinstance(self.max_features, float):
+            return max(1, int(self.max_features * n_features))
+        if isinstance(self.max_features, int):
+            return min(self.max_features, n_features)
+
+        raise ValueError(f"Unknown max_features {self.max_features}, expected an int, a float, 'sqrt' or None")
+
+    def _split(self, X: np.ndarray, samples: np.ndarray, start: int, end: int, column: int, value: int) -> int:
+        """
+        Partition samples[start:end] in place, the samples going to the left
+        child first, and return where the right child's samples start.
+        """
+        node_samples = samples[start:end]
+        mask = X[node_samples, column] <= value
+        samples[start:end] = np.concatenate((node_samples[mask], node_samples[~mask]))
+
+        return start + int(np.count_nonzero(mask))
+
+    def _best_column_split(self, X: np.ndarray, y: np.ndarray, samples: np.ndarray, column: int) -> Tuple[int, float]:
+        n_classes = len(self.classes_)
+        column_bins = X[samples, column]
+        n_bins = len(self.thresholds_[column])
+
+        # Only a few of the bins have samples in deep nodes, count those only
+        present_bins = None
+        if n_bins > len(column_bins):
+            present_bins, column_bins = np.unique(column_bins, return_inverse=True)
+            n_bins = len(present_bins)
+
+        # Class counts of each bin, then of each side of every threshold
+        counts = np.bincount(column_bins.astype(np.intp) * n_classes + y,
+                             minlength=n_bins * n_classes).reshape(n_bins, n_classes)
+        left = np.cumsum(counts, axis=0)
+        right = left[-1] - left
+
+        left_count = left.sum(axis=1)
+        right_count = right.sum(axis=1)
+        total_count = len(y)
+        entropies = left_count / total_count * histogram_entropy(left) \
+            + right_count / total_count * histogram_entropy(right)
+
+        # Empty bins would repeat the split of the previous threshold
+        entropies[~counts.any(axis=1)] = float('inf')
+        best = int(np.argmin(entropies))
+        min_entropy = float(entropies[best])
+
+        if present_bins is not None:
+            best = int(present_bins[best])
+        return best, min_entropy
+
+    def _best_split(self, X: np.ndarray, y: np.ndarray, samples: np.ndarray) -> Tuple[int, float, float]:
         min_entropy = float('inf')
         best_column = None
         split_value = None
 
-        for column in range(X.shape[1]):
-            value, entropy = self._best_column_split(X, y, column)
+        columns = range(X.shape[1])
+        if self._n_features < X.shape[1]:
+            columns = np.sort(self._rng.choice(X.shape[1], self._n_features, replace=False))
+
+        if self._executor is not None:
+            splits = self._executor.map(lambda column: self._best_column_split(X, y, samples, column), columns)
+        else:
+            splits = (self._best_column_split(X, y, samples, column) for column in columns)
 
+        for column, (value, entropy) in zip(columns, splits):
             if entropy < min_entropy:
                 min_entropy = entropy
-                best_column = column
+                best_column = int(column)
                 split_value = value
 
         return best_column, split_value, min_entropy
     
-    def _build_tree(self, X: np.ndarray, y: np.ndarray, depth: int) -> DecisionTreeNode:
-        if depth == self.max_depth:
-            return None
-        
-        # Find the best column to split on
-        column, value, entropy = self._best_split(X, y)
-
-        # Compute the information gain
-        gain = self._entropy(y) - entropy
-        
-        # Split the data
-        left_X, right_X, left_y, right_y = self._split(X, y, column, value)
-
-        node = DecisionTreeNode()
-        node.entropy = entropy
-        node.column = column
-        node.split_value = value
-        node.probs = {c: np.mean(y == c) for c in np.unique(y)}
-        node.prediction = max(node.probs, key=node.probs.get)
-
-        # Stop if information gain is too low or if the node is pure
-        if gain < self.min_info_gain or entropy == 0:
-            return node
-        
-        node.left = self._build_tree(left_X, left_y, depth + 1)
-        node.right = self._build_tree(right_X, right_y, depth + 1)
-
-        return node
-
-
-    def _predict_one(self, x: np.ndarray) -> float:
-        node = self.tree
-        prediction = None
-
-        while node:
-            prediction = node.prediction
-            if x[node.column] <= node.split_value:
-                node = node.left
-            else:
-                node = node.right
-
-        return prediction
+    def _build_tree(self, X: np.ndarray, y: np.ndarray) -> DecisionTreeNode:
+        """
+        Build the tree depth first, with a stack instead of recursion. The
+        samples of a node are the range samples[start:end] of a single array
+        of row indices, which is partitioned in place between its children.
+        """
+        samples = np.arange(len(y))
+        root = DecisionTreeNode()
+
+        # the node to attach the new node to, as its left or right child,
+        # then the range of samples and the depth of the new node
+        stack = [(root, 'left', 0, len(y), 0)]
+
+        while stack:
+            parent, side, start, end, depth = stack.pop()
+
+            # An empty side predicts like its parent
+            if depth == self.max_depth or start == end:
+                continue
+
+            node_samples = samples[start:end]
+            node_y = y[node_samples]
+
+            # Find the best column to split on
+            column, value, entropy = self._best_split(X, node_y, node_samples)
+
+            # Compute the information gain
+            counts = np.bincount(node_y, minlength=len(self.classes_))
+            gain = float(histogram_entropy(counts)) - entropy
+
+            node = DecisionTreeNode()
+            node.entropy = entropy
+            node.column = column
+            node.split_value = self.thresholds_[column][value]
+            node.probs = {self.classes_[c]: counts[c] / len(node_y) for c in np.flatnonzero(counts)}
+            node.prediction = self.classes_[np.argmax(counts)]
+            setattr(parent, side, node)
+
+            # Stop if information gain is too low or if the node is pure
+            if gain < self.min_info_gain or entropy == 0:
+                continue
+
+            # Split the data
+            middle = self._split(X, samples, start, end, column, value)
+
+            stack.append((node, 'right', middle, end, depth + 1))
+            stack.append((node, 'left', start, middle, depth + 1))
+
+        return root.left
+
+    def _compile(self) -> None:
+        """
+        Flatten the tree into arrays, numbering the nodes breadth first.
+        """
+        nodes = [self.tree] if self.tree is not None else []
+        depths = [0] * len(nodes)
+        for node, depth in zip(nodes, depths):
+            for child in (node.left, node.right):
+                if child is not None:
+                    nodes.append(child)
+                    depths.append(depth + 1)
+        ids = {id(node): i for i, node in enumerate(nodes)}
+
+        self.feature_ = np.array([node.column for node in nodes], dtype=np.intp)
+        self.threshold_ = np.array([node.split_value for node in nodes], dtype=np.float64)
+        self.left_ = np.array([ids.get(id(node.left), -1) for node in nodes], dtype=np.intp)
+        self.right_ = np.array([ids.get(id(node.right), -1) for node in nodes], dtype=np.intp)
+
+        self.value_ = np.zeros((len(nodes), len(self.classes_)), dtype=np.float64)
+        class_index = {c: i for i, c in enumerate(self.classes_)}
+        for i, node in enumerate(nodes):
+            for c, probability in node.probs.items():
+                self.value_[i, class_index[c]] = probability
+
+        self._link()
+        self._depth = max(depths, default=0)
+
+    def _link(self) -> None:
+        # the child of node i is _children[2 * i + (x <= threshold)], a node
+        # without a child on that side being its own child, so that rows
+        # stop moving once they reached their last node
+        ids = np.arange(len(self.feature_))
+        right = np.where(self.right_ >= 0, self.right_, ids)
+        left = np.where(self.left_ >= 0, self.left_, ids)
+        self._children = np.column_stack((right, left)).ravel()
+
+    def _apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Return the node each row ends in. All the rows go down the tree
+        together, one level at a time, with a gather of the feature of the
+        current node of each row.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        values = X.ravel()
+        row_starts = np.arange(0, X.size, X.shape[1])
+        nodes = np.zeros(len(X), dtype=np.intp)
+
+        for _ in range(self._depth):
+            go_left = values.take(row_starts + self.feature_.take(nodes)) <= self.threshold_.take(nodes)
+            nodes = self._children.take(2 * nodes + go_left)
+
+        return nodes
@@ -0,0 +1,55 @@
+from sklearn.preprocessing import LabelEncoder
+from sklearn.compose import ColumnTransformer
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import classification_report
+from tabulate import tabulate
+
+import time
+
+# Hotfix to allow script to be run from anywhere
+__import__('sys').path.append('..')
+
+from preprocessing.utils import *
+
+from random_forest import RandomForest
+
+
+traffic_data, labels = load_network_dataset()
+
+label_encoder = LabelEncoder()
+labels = label_encoder.fit_transform(labels)
+
+IP_FIELDS = ['origin_ip', 'response_ip']
+
+# split the ip fields into 4 columns
+ip_transformer = ColumnTransformer(
+    transformers=[
+        ('ip_splitter', IPTransformer(IP_FIELDS), IP_FIELDS),
+    ],
+    remainder='passthrough'
+)
+
+updated_traffic_data = ip_transformer.fit_transform(traffic_data)
+updated_traffic_data = pd.DataFrame(updated_traffic_data)
+
+X_train, X_test, y_train, y_test = train_test_split(updated_traffic_data, labels, test_size=0.2, stratify=labels)
+
+# Trade accuracy for latency with the number of trees
+results = []
+for n_estimators in [1, 5, 10, 25, 50]:
+    rf = RandomForest(n_estimators=n_estimators, oob_score=True, n_jobs=-1, random_state=0)
+    rf.fit(X_train, y_train)
+
+    start = time.perf_counter()
+    rf_predict = rf.predict(X_test)
+    latency = time.perf_counter() - start
+
+    accuracy = np.mean(rf_predict == y_test)
+    results.append([n_estimators, rf.oob_score_, accuracy, latency * 1e6 / len(X_test)])
+
+print(tabulate(results, headers=['trees', 'oob accuracy', 'test accuracy', 'us / flow']))
+
+# Evaluate the largest forest
+report = classification_report(y_test, rf_predict, target_names=label_encoder.classes_)
+
+print(report)
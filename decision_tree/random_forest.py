@@ -0,0 +1,232 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+from pandas import DataFrame
+import numpy as np
+import os
+
+from preprocessing.serialization import load_arrays, save_arrays
+
+# the scripts of this directory import the tree module itself, the rest of
+# the project imports it from the package
+try:
+    from decision_tree.decision_tree import DecisionTree
+except ImportError:
+    from decision_tree import DecisionTree
+
+# training data copied into each worker process by the pool initializer
+worker_data: Tuple[np.ndarray, np.ndarray] = None
+
+
+def init_worker(X: np.ndarray, y: np.ndarray) -> None:
+    global worker_data
+    worker_data = (X, y)
+
+
+def fit_tree(task: Tuple[dict, np.ndarray, int]) -> DecisionTree:
+    """
+    Fit a tree on the given rows of the worker's training data.
+    """
+    params, samples, seed = task
+    X, y = worker_data
+
+    tree = DecisionTree(random_state=seed, **params)
+    tree.fit(X[samples], y[samples])
+    return tree
+
+
+class RandomForest():
+    """
+    A random forest classifier: decision trees trained on bootstrap samples
+    of the data, each node splitting on a random subset of the features.
+
+    Parameters:
+    - n_estimators: The number of trees.
+    - max_depth, min_info_gain, max_bins: The parameters of each DecisionTree.
+    - max_features: The features tried at each node, see DecisionTree.
+    - bootstrap: Train each tree on a sample of the data drawn with
+      replacement, otherwise on all of it.
+    - voting: 'soft' to average the class probabilities of the trees, 'hard'
+      to take the class most trees predict.
+    - oob_score: Compute oob_score_, the accuracy on each sample of the trees
+      that did not see it during training.
+    - n_jobs: The number of processes training the trees, -1 for one per CPU.
+    - random_state: The seed of the bootstrap samples and of the trees.
+
+    The bootstrap samples and the seeds of the trees are drawn before the
+    trees are trained, so the forest does not depend on n_jobs.
+
+    save and load (see preprocessing/serialization.py) keep each tree in a
+    subdirectory of the forest's, memory mapped on load like DecisionTree.
+    """
+    VOTING = ('soft', 'hard')
+
+    def __init__(
+            self,
+            n_estimators: int = 100,
+            max_depth: int = 5,
+            min_info_gain: float = 0.1,
+            max_bins: int = None,
+            max_features: int | float | str = 'sqrt',
+            bootstrap: bool = True,
+            voting: str = 'soft',
+            oob_score: bool = False,
+            n_jobs: int = 1,
+            random_state: int = None
+        ) -> None:
+        if voting not in self.VOTING:
+            raise ValueError(f"Unknown voting {voting}, expected one of {self.VOTING}")
+        if oob_score and not bootstrap:
+            raise ValueError("Out of bag score needs bootstrap samples")
+
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.min_info_gain = min_info_gain
+        self.max_bins = max_bins
+        self.max_features = max_features
+        self.bootstrap = bootstrap
+        self.voting = voting
+        self.oob_score = oob_score
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+        self.trees: List[DecisionTree] = None
+        self.classes_: np.ndarray = None
+        self.oob_score_: float = None
+
+    def fit(self, X: np.ndarray | DataFrame, y: np.ndarray) -> "RandomForest":
+        """
+        Fit the trees to the data.
+        """
+        X = X.to_numpy() if isinstance(X, DataFrame) else X
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) != len(y):
+            raise ValueError(f"X has {len(X)} rows but y has {len(y)} labels")
+
+        # The trees are trained on class indices, so they all agree on them
+        self.classes_, y = np.unique(y, return_inverse=True)
+
+        rng = np.random.default_rng(self.random_state)
+        seeds = rng.integers(2 ** 31, size=self.n_estimators)
+        if self.bootstrap:
+            samples = [rng.integers(0, len(X), len(X)) for _ in range(self.n_estimators)]
+        else:
+            samples = [np.arange(len(X))] * self.n_estimators
+
+        params = {
+            'max_depth': self.max_depth,
+            'min_info_gain': self.min_info_gain,
+            'max_bins': self.max_bins,
+            'max_features': self.max_features,
+        }
+        tasks = [(params, sample, int(seed)) for sample, seed in zip(samples, seeds)]
+
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        if n_jobs is not None and n_jobs > 1:
+            with ProcessPoolExecutor(n_jobs, initializer=init_worker, initargs=(X, y)) as pool:
+                self.trees = list(pool.map(fit_tree, tasks))
+        else:
+            init_worker(X, y)
+            self.trees = [fit_tree(task) for task in tasks]
+            init_worker(None, None)
+
+        if self.oob_score:
+            self.oob_score_ = self._oob_score(X, y, samples)
+
+        return self
+
+    def predict(self, X: np.ndarray | DataFrame) -> np.ndarray:
+        X = X.to_numpy() if isinstance(X, DataFrame) else X
+
+        if len(X.shape) == 1:
+            return self.predict(X.reshape(1, -1))[0]
+
+        return self.classes_[np.argmax(self._votes(X, self.trees), axis=1)]
+
+    def predict_proba(self, X: np.ndarray | DataFrame) -> np.ndarray:
+        """
+        Predict the probability of each class in classes_, as the mean of the
+        probabilities of the trees, or their share of the votes for 'hard'
+        voting.
+        """
+        X = X.to_numpy() if isinstance(X, DataFrame) else X
+
+        if len(X.shape) == 1:
+            return self.predict_proba(X.reshape(1, -1))[0]
+
+        return self._votes(X, self.trees) / len(self.trees)
+
+    def save(self, path: str) -> None:
+        """
+        Save the fitted forest into the directory path, tree i into the
+        subdirectory tree_i.
+        """
+        if self.trees is None:
+            raise ValueError("Forest not fitted")
+
+        for i, tree in enumerate(self.trees):
+            tree.save(os.path.join(path, f"tree_{i}"))
+
+        params = {
+            'n_estimators': self.n_estimators,
+            'max_depth': self.max_depth,
+            'min_info_gain': self.min_info_gain,
+            'max_bins': self.max_bins,
+            'max_features': self.max_features,
+            'bootstrap': self.bootstrap,
+            'voting': self.voting,
+            'oob_score': self.oob_score,
+            'n_jobs': self.n_jobs,
+            'random_state': self.random_state,
+            'trees': len(self.trees),
+            'oob_score_': self.oob_score_,
+        }
+        save_arrays(path, 'RandomForest', params, {'classes_': self.classes_})
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> "RandomForest":
+        """
+        Load a forest saved with save, see DecisionTree.load for mmap_mode.
+        """
+        params, arrays = load_arrays(path, 'RandomForest', mmap_mode)
+        trees = params.pop('trees')
+        oob_score = params.pop('oob_score_')
+
+        forest = cls(**params)
+        forest.classes_ = arrays['classes_']
+        forest.oob_score_ = oob_score
+        forest.trees = [DecisionTree.load(os.path.join(path, f"tree_{i}"), mmap_mode)
+                        for i in range(trees)]
+        return forest
+
+    def _votes(self, X: np.ndarray, trees: List[DecisionTree]) -> np.ndarray:
+        """
+        Sum the votes of the trees for each class of the forest. A tree only
+        knows the classes of its bootstrap sample, which are class indices of
+        the forest.
+        """
+        if self.trees is None:
+            raise ValueError("Forest not fitted")
+
+        X = np.asarray(X, dtype=np.float64)
+        votes = np.zeros((len(X), len(self.classes_)), dtype=np.float64)
+
+        for tree in trees:
+            if self.voting == 'soft':
+                votes[:, tree.classes_] += tree.predict_proba(X)
+            else:
+                votes[np.arange(len(X)), tree.predict(X)] += 1
+
+        return votes
+
+    def _oob_score(self, X: np.ndarray, y: np.ndarray, samples: List[np.ndarray]) -> float:
+        # each sample is scored only by the trees it was left out of
+        votes = np.zeros((len(X), len(self.classes_)), dtype=np.float64)
+
+        for tree, sample in zip(self.trees, samples):
+            out_of_bag = np.ones(len(X), dtype=bool)
+            out_of_bag[sample] = False
+            votes[out_of_bag] += self._votes(X[out_of_bag], [tree])
+
+        # samples drawn in every bootstrap have no out of bag prediction
+        scored = votes.any(axis=1)
+        return float(np.mean(np.argmax(votes[scored], axis=1) == y[scored]))
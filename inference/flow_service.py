@@ -0,0 +1,334 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import stat
+import sys
+import threading
+import time
+
+# Hotfix to allow script to be run from anywhere
+__import__('sys').path.append('..')
+
+from preprocessing.utils import *
+from decision_tree.decision_tree import DecisionTree
+from logistic_regression.logistic_regression import LogisticRegression
+from inference.pipeline import ThreatPipeline
+
+# the models the service can train at startup
+MODEL_TYPES = ('tree', 'logistic')
+
+
+def train_model(model_type='tree'):
+    # a ThreatPipeline trained on the network dataset
+    traffic_data, labels = load_network_dataset()
+    if model_type == 'tree':
+        return ThreatPipeline(DecisionTree()).fit(traffic_data, labels)
+
+    model = LogisticRegression(optimizer='adam', dtype=np.float32, random_state=0)
+    return ThreatPipeline(model, learning_rate=0.01, epochs=100, batch_size=32).fit(traffic_data, labels)
+
+
+class LatencyStats:
+    """
+    Counters of the scored records: how many, how fast, and the p50 / p99
+    latency from the arrival of a record to its reply, computed over the
+    last window records.
+    """
+    def __init__(self, window=100_000, clock=time.perf_counter):
+        self.clock = clock
+        self.latencies = np.zeros(window)
+        self.records = 0
+        self.batches = 0
+        self.errors = 0
+        self.started = clock()
+        self.lock = threading.Lock()
+
+    def add_batch(self, latencies, errors=0):
+        latencies = np.asarray(latencies)[-len(self.latencies):]
+        with self.lock:
+            positions = (self.records + np.arange(len(latencies))) % len(self.latencies)
+            self.latencies[positions] = latencies
+            self.records += len(latencies)
+            self.batches += 1
+            self.errors += errors
+
+    def summary(self):
+        with self.lock:
+            latencies = self.latencies[:min(self.records, len(self.latencies))]
+            elapsed = self.clock() - self.started
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if len(latencies) else (0.0, 0.0)
+
+            return {
+                'records': self.records,
+                'batches': self.batches,
+                'errors': self.errors,
+                'records_per_second': self.records / elapsed if elapsed else 0.0,
+                'mean_batch_size': self.records / self.batches if self.batches else 0.0,
+                'p50_ms': float(p50),
+                'p99_ms': float(p99),
+            }
+
+
+class LineWriter:
+    """
+    Thread safe writer of reply lines to a text or binary stream, counting
+    the records submitted and not replied to yet. A client that went away
+    is not an error, its replies are dropped.
+    """
+    def __init__(self, stream, binary=False):
+        self.stream = stream
+        self.binary = binary
+        self.closed = False
+        self.pending = 0
+        self.lock = threading.Condition()
+
+    def expect(self):
+        with self.lock:
+            self.pending += 1
+
+    def reply(self, line):
+        with self.lock:
+            self.pending -= 1
+            self.write(line)
+            self.lock.notify_all()
+
+    def drain(self):
+        # wait for the replies to every record submitted
+        with self.lock:
+            self.lock.wait_for(lambda: self.pending == 0)
+
+    def write(self, line):
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.stream.write(f"{line}\n".encode() if self.binary else f"{line}\n")
+            except (OSError, ValueError):
+                self.closed = True
+
+    def flush(self):
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.stream.flush()
+            except (OSError, ValueError):
+                self.closed = True
+
+
+class MicroBatcher:
+    """
+    Scores flow records in batches, with one vectorized predict of the
+    ThreatPipeline per batch.
+
+    A batch is scored as soon as it has batch_size records, or max_delay
+    seconds after its first record arrived, whichever comes first, which
+    bounds the latency added by batching. Records queued meanwhile fill the
+    next batch right away. A single thread scores the batches, so the
+    replies of each client come in the order of its records.
+    """
+    def __init__(self, model, columns, batch_size=256, max_delay=0.005, stats=None):
+        self.model = model
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.stats = LatencyStats() if stats is None else stats
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, record, output):
+        # score the record and reply its predicted class to output
+        output.expect()
+        self.queue.put((record, output, time.perf_counter()))
+
+    def close(self):
+        # score the records already submitted, then stop
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = item[2] + self.max_delay
+            closing = False
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+
+            self.score(batch)
+            if closing:
+                return
+
+    def predict(self, records):
+        return self.model.predict(records)
+
+    def score(self, batch):
+        records = [record for record, output, arrival in batch]
+
+        # a record without the right number of fields is an error, and so
+        # is any record failing to parse, found by scoring one by one
+        valid = [record.count(',') == len(self.columns) - 1 for record in records]
+        predictions = [None] * len(records)
+        rows = [i for i, ok in enumerate(valid) if ok]
+        try:
+            for i, prediction in zip(rows, self.predict([records[i] for i in rows])):
+                predictions[i] = prediction
+        except Exception:
+            for i in rows:
+                try:
+                    predictions[i] = self.predict([records[i]])[0]
+                except Exception:
+                    pass
+
+        # counted before replying, so a STATS after these records sees them
+        done = time.perf_counter()
+        self.stats.add_batch([done - arrival for record, output, arrival in batch],
+                             errors=predictions.count(None))
+
+        outputs = {}
+        for (record, output, arrival), prediction in zip(batch, predictions):
+            output.reply('error' if prediction is None else prediction)
+            outputs[id(output)] = output
+        for output in outputs.values():
+            output.flush()
+
+
+def handle_line(line, batcher, output):
+    # a flow record to score, the header of the traffic file (skipped), or
+    # the STATS command, answered with the counters as JSON after the
+    # replies to the records before it
+    line = line.strip()
+    if not line or line.startswith(f"{batcher.columns[0]},"):
+        return
+
+    if line == 'STATS':
+        output.drain()
+        output.write(json.dumps(batcher.stats.summary()))
+        output.flush()
+        return
+
+    batcher.submit(line, output)
+
+
+class FlowHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        output = LineWriter(self.wfile, binary=True)
+        for line in self.rfile:
+            handle_line(line.decode(errors='replace'), self.server.batcher, output)
+
+        # the connection is closed once handle returns
+        output.drain()
+
+
+class UnixFlowServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TcpFlowServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def remove_socket(path):
+    # unlink the socket at path, if any; any other file is left alone
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def report_stats(stats, interval):
+    while True:
+        time.sleep(interval)
+        print(json.dumps(stats.summary()), file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Score flow records in the traffic.in schema, one per line, "
+                    "read from stdin or from the clients of a local socket")
+    parser.add_argument('--model', default=None, metavar='PATH',
+                        help="directory of a model saved with --save, loaded instead of training one")
+    parser.add_argument('--model-type', choices=MODEL_TYPES, default='tree',
+                        help="model trained on the network dataset at startup, without --model")
+    parser.add_argument('--save', default=None, metavar='PATH',
+                        help="save the trained model into this directory")
+    parser.add_argument('--socket', default=None,
+                        help="unix socket path to listen on, instead of stdin")
+    parser.add_argument('--port', type=int, default=None,
+                        help="localhost tcp port to listen on, instead of stdin")
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help="maximum number of records per predict call")
+    parser.add_argument('--max-delay-ms', type=float, default=5.0,
+                        help="maximum time a record waits for its batch to fill")
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help="seconds between two reports of the counters on stderr")
+    args = parser.parse_args()
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.socket is not None and args.port is not None:
+        parser.error("--socket and --port are exclusive")
+    # only a stale socket is replaced, never another file
+    if args.socket is not None and os.path.exists(args.socket) \
+            and not stat.S_ISSOCK(os.stat(args.socket).st_mode):
+        parser.error(f"{args.socket} exists and is not a socket")
+
+    if args.model is not None:
+        model = ThreatPipeline.load(args.model)
+    else:
+        model = train_model(args.model_type)
+    if args.save is not None:
+        model.save(args.save)
+    batcher = MicroBatcher(model, model.columns, args.batch_size,
+                           args.max_delay_ms / 1000).start()
+
+    if args.stats_interval > 0:
+        threading.Thread(target=report_stats, args=(batcher.stats, args.stats_interval),
+                         daemon=True).start()
+
+    if args.socket is not None or args.port is not None:
+        if args.socket is not None:
+            remove_socket(args.socket)
+            server = UnixFlowServer(args.socket, FlowHandler)
+        else:
+            server = TcpFlowServer(('127.0.0.1', args.port), FlowHandler)
+
+        server.batcher = batcher
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket is not None:
+                remove_socket(args.socket)
+    else:
+        output = LineWriter(sys.stdout)
+        for line in sys.stdin:
+            handle_line(line, batcher, output)
+
+    batcher.close()
+    print(json.dumps(batcher.stats.summary()), file=sys.stderr)
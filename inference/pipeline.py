@@ -0,0 +1,213 @@
+import os
+import numpy as np
+
+from sklearn.preprocessing import StandardScaler
+
+from preprocessing.utils import IP_FIELDS, IPTransformer, encode_ips, get_network_columns, \
+    network_features
+from preprocessing.durations import parse_time_bytes
+from preprocessing.flow_csv import CHUNK_BYTES, FlowCsvReader, split_fields
+from preprocessing.serialization import load_arrays, load_scaler, save_arrays, save_scaler
+from decision_tree.decision_tree import DecisionTree
+from logistic_regression.logistic_regression import LogisticRegression
+
+
+class ThreatPipeline:
+    """
+    The featurization of raw flow records (network_features), an optional
+    StandardScaler and a model, fused for scoring.
+
+    Once fitted, the pipeline is compiled: the column of the feature matrix
+    each field of a record goes to is computed once and, for a
+    LogisticRegression, the scaler is folded into the weights,
+    W' = W / scale[:, None] and b' = b - (mean / scale) @ W, so the logits
+    of the raw features are X @ W' + b'. Scoring then goes from the bytes
+    of the records (split with preprocessing/flow_csv.py) to a single
+    contiguous float matrix, filled field by field, and the model, with no
+    DataFrame in between.
+
+    Parameters:
+    - model: the unfitted LogisticRegression or DecisionTree, trained on the
+      class indices of the labels
+    - scale: standardize the features; None to do it for a
+      LogisticRegression only, trees do not need it
+    - encoding: the ip encoding, see IPTransformer
+    - columns: the fields of the records, the header of the traffic file
+      by default
+    - fit_params: the keyword arguments of model.fit
+    """
+    def __init__(self, model, scale=None, encoding='octets', columns=None, **fit_params):
+        if not isinstance(model, (LogisticRegression, DecisionTree)):
+            raise ValueError("The model must be a LogisticRegression or a DecisionTree")
+
+        self.model = model
+        self.scale = isinstance(model, LogisticRegression) if scale is None else scale
+        self.encoding = encoding
+        self.columns = list(get_network_columns() if columns is None else columns)
+        self.fit_params = fit_params
+
+        if self.scale and not isinstance(model, LogisticRegression):
+            raise ValueError("Only a LogisticRegression can be scaled")
+
+        self.ip_transformer = IPTransformer(IP_FIELDS, encoding).fit(None)
+        self.scaler: StandardScaler = None
+        self.classes_: np.ndarray = None
+        self.n_features_: int = None
+        self.weights_: np.ndarray = None
+        self.bias_: np.ndarray = None
+        self._indexes = None
+        self._ips = None
+        self._numbers = None
+        self._duration = None
+
+    def fit(self, df, labels):
+        """
+        Fit the scaler and the model on a parsed traffic frame (see
+        load_network_dataset) and its labels, then compile the pipeline.
+        """
+        X = network_features(df[self.columns], self.ip_transformer)
+        self.classes_, y = np.unique(np.asarray(labels), return_inverse=True)
+
+        if self.scale:
+            self.scaler = StandardScaler()
+            X = self.scaler.fit_transform(X)
+        self.model.fit(X, y, **self.fit_params)
+
+        self._compile()
+        return self
+
+    def featurize(self, records):
+        """
+        Featurize raw flow records, lines of the traffic file (a list of
+        strings or the bytes of several lines), into the contiguous float64
+        matrix network_features gives for the parsed records.
+        """
+        return self._features(self._split(records))
+
+    def predict(self, records):
+        # the class name of each record
+        return self.classes_[self._predict_indices(self.featurize(records))]
+
+    def predict_proba(self, records):
+        """
+        Predict the probability of each class in classes_ for each record.
+        """
+        X = self.featurize(records)
+        if self.weights_ is None:
+            return self.model.predict_proba(X)
+        return self.model.softmax(X @ self.weights_ + self.bias_)
+
+    def iter_predict_file(self, path, chunk_bytes=CHUNK_BYTES):
+        # yield the class names of the flows of a traffic file, a chunk of
+        # flows at a time, read memory mapped
+        reader = FlowCsvReader(path, header=True, chunk_bytes=chunk_bytes)
+        for values in reader.iter_chunks(self._indexes):
+            yield self.classes_[self._predict_indices(self._features(values))]
+
+    def save(self, path):
+        """
+        Save the fitted pipeline into the directory path, the model and the
+        scaler in subdirectories (see preprocessing/serialization.py). The
+        weights are folded again on load.
+        """
+        if self.classes_ is None:
+            raise ValueError("Pipeline not fitted")
+
+        self.model.save(os.path.join(path, 'model'))
+        if self.scaler is not None:
+            save_scaler(self.scaler, os.path.join(path, 'scaler'))
+
+        params = {
+            'model': type(self.model).__name__,
+            'scale': self.scale,
+            'encoding': self.encoding,
+            'columns': self.columns,
+        }
+        save_arrays(path, 'ThreatPipeline', params, {'classes_': self.classes_})
+
+    @classmethod
+    def load(cls, path):
+        params, arrays = load_arrays(path, 'ThreatPipeline')
+
+        model_class = LogisticRegression if params['model'] == 'LogisticRegression' else DecisionTree
+        pipeline = cls(model_class.load(os.path.join(path, 'model')), params['scale'],
+                       params['encoding'], params['columns'])
+        if pipeline.scale:
+            pipeline.scaler = load_scaler(os.path.join(path, 'scaler'))
+        pipeline.classes_ = arrays['classes_']
+
+        pipeline._compile()
+        return pipeline
+
+    def _compile(self):
+        """
+        Compute where each field of a record goes in the feature matrix and
+        fold the scaler into the weights of a LogisticRegression.
+        """
+        # network_features puts the encoded ips first, then the other fields
+        # in the order of the records
+        ip_width = len(self.ip_transformer.get_feature_names_out([])) // len(IP_FIELDS)
+        self._ips = [(self.columns.index(column), i * ip_width)
+                     for i, column in enumerate(IP_FIELDS)]
+
+        others = [column for column in self.columns if column not in IP_FIELDS]
+        positions = {column: len(IP_FIELDS) * ip_width + i for i, column in enumerate(others)}
+        self._duration = (self.columns.index('flow_duration'), positions['flow_duration'])
+        self._numbers = [(self.columns.index(column), positions[column])
+                         for column in others if column != 'flow_duration']
+
+        self._indexes = list(range(len(self.columns)))
+        self.n_features_ = len(IP_FIELDS) * ip_width + len(others)
+
+        self.weights_, self.bias_ = None, None
+        if isinstance(self.model, LogisticRegression):
+            weights = np.asarray(self.model.weights, dtype=np.float64)
+            bias = np.asarray(self.model.bias, dtype=np.float64)
+            if self.scaler is not None:
+                bias = bias - (self.scaler.mean_ / self.scaler.scale_) @ weights
+                weights = weights / self.scaler.scale_[:, None]
+
+            self.weights_ = np.ascontiguousarray(weights, dtype=self.model.dtype)
+            self.bias_ = bias.astype(self.model.dtype)
+
+    def _split(self, records):
+        # the values of every field of the records, as bytes arrays
+        if self._indexes is None:
+            raise ValueError("Pipeline not fitted")
+
+        if isinstance(records, (bytes, bytearray, memoryview)):
+            count = None
+        else:
+            records = [record.rstrip('\n') for record in records]
+            count = len(records)
+            records = '\n'.join(records).encode()
+
+        values, stopped = split_fields(np.frombuffer(records, dtype=np.uint8), self._indexes)
+        if count is not None and (0 if values is None else len(values[0])) != count:
+            raise ValueError("Empty flow record")
+        if values is None:
+            return [np.zeros(0, dtype='S1')] * len(self._indexes)
+
+        return values
+
+    def _features(self, values):
+        X = np.empty((len(values[0]), self.n_features_), dtype=np.float64)
+
+        # captures repeat the same few addresses, each one is encoded once
+        for index, position in self._ips:
+            ips, codes = np.unique(values[index], return_inverse=True)
+            for i, column in enumerate(encode_ips(ips.astype(str), self.encoding)):
+                X[:, position + i] = column[codes]
+
+        index, position = self._duration
+        X[:, position] = parse_time_bytes(values[index])
+
+        for index, position in self._numbers:
+            X[:, position] = values[index].astype(np.float64)
+
+        return X
+
+    def _predict_indices(self, X):
+        if self.weights_ is None:
+            return self.model.predict(X)
+        return np.argmax(X @ self.weights_ + self.bias_, axis=1)
@@ -1,7 +1,7 @@
 from sklearn.compose import ColumnTransformer
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import confusion_matrix, classification_report
-from sklearn.preprocessing import OneHotEncoder
+from sklearn.preprocessing import LabelEncoder
 from sklearn.preprocessing import StandardScaler
 
 import numpy as np
@@ -34,9 +34,9 @@ updated_traffic_data = pd.DataFrame(updated_traffic_data)
 
 X_train, X_test, y_train, y_test = train_test_split(updated_traffic_data, labels, test_size=0.2, stratify=labels)
 
-# One-hot encode the labels
-encoder = OneHotEncoder()
-y_train = encoder.fit_transform(y_train.reshape(-1, 1)).toarray()
+# Encode the labels as class indices
+encoder = LabelEncoder()
+y_train = encoder.fit_transform(y_train)
 
 # Scale the data to avoid huge initial errors
 scaler = StandardScaler()
@@ -44,7 +44,7 @@ X_train = scaler.fit_transform(X_train)
 X_test = scaler.transform(X_test)
 
 # Classify using Custom Logistic Regression
-lr = LogisticRegression()
+lr = LogisticRegression(dtype=np.float32)
 lr.fit(X_train, y_train, learning_rate=0.01, epochs=500, batch_size=32, verbose=True)
 lr_predict = lr.predict(X_test)
 
@@ -52,6 +52,6 @@ lr_predict = encoder.inverse_transform(lr_predict)
 
 # Evaluate the model
 lr_cmat = confusion_matrix(y_test, lr_predict)
-report = classification_report(y_test, lr_predict, target_names=encoder.categories_[0])
+report = classification_report(y_test, lr_predict, target_names=encoder.classes_)
 
 print(report)
@@ -1,18 +1,70 @@
 import numpy as np
-from pandas import DataFrame
+import scipy.sparse as sp
+from typing import Callable, Dict, Tuple
+from pandas import DataFrame, Series
+
+from preprocessing.serialization import load_arrays, save_arrays
 
 
 class LogisticRegression:
     """
     Class that implements a Softmax Logistic Regression model
 
+    Parameters:
+    - optimizer: 'sgd', 'momentum' or 'adam'
+    - momentum: float momentum of the 'momentum' optimizer
+    - beta1, beta2, epsilon: float parameters of the 'adam' optimizer
+    - random_state: int seed used to initialize the weights and shuffle the
+      data; None to seed from the global np.random state
+    - dtype: dtype of the weights and of the computations, np.float32 halves
+      the memory used
+
+    The training data can be a dense array or a scipy.sparse matrix (CSR
+    preferably). The labels can be either a one-hot matrix of shape (m, k)
+    or a vector of m integer class indices; predict returns the labels in
+    the same format the model was trained with.
+
     Attributes:
     - weights: np.ndarray containing k weights for each of the k features
     - bias: np.ndarray containing k (float) bias terms for each of the k features
+    - validation_losses: np.ndarray containing the validation loss after each
+      epoch of the last fit, if early stopping was used
+
+    A fitted model can be saved with save and loaded back, memory mapped,
+    with load (see preprocessing/serialization.py). The optimizer state is
+    not saved, partial_fit on a loaded model starts it over.
     """
-    def __init__(self) -> None:
+    OPTIMIZERS = ('sgd', 'momentum', 'adam')
+    SCHEDULES = ('constant', 'time', 'exponential')
+
+    def __init__(
+            self,
+            optimizer: str = 'sgd',
+            momentum: float = 0.9,
+            beta1: float = 0.9,
+            beta2: float = 0.999,
+            epsilon: float = 1e-8,
+            random_state: int = None,
+            dtype: np.dtype = np.float64
+        ) -> None:
+        if optimizer not in self.OPTIMIZERS:
+            raise ValueError(f"Unknown optimizer {optimizer}, expected one of {self.OPTIMIZERS}")
+
+        self.optimizer = optimizer
+        self.momentum = momentum
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.random_state = random_state
+        self.dtype = np.dtype(dtype)
+
         self.weights: np.ndarray = None
         self.bias: np.ndarray = None
+        self.validation_losses: np.ndarray = None
+        self._rng: np.random.Generator = None
+        self._optimizer_state: Dict[str, np.ndarray] = None
+        self._steps = 0
+        self._one_hot = True
 
     def fit(
             self,
@@ -21,6 +73,13 @@ class LogisticRegression:
             learning_rate: float = 0.01,
             epochs: int = 1000,
             batch_size: int = 32,
+            loss_every: int = 1,
+            lr_schedule: str | Callable[[int], float] = 'constant',
+            decay: float = 0.01,
+            validation_data: Tuple[np.ndarray, np.ndarray] = None,
+            validation_split: float = 0.0,
+            patience: int = 10,
+            tol: float = 1e-4,
             verbose: bool = False
         ) -> np.ndarray:
         """
@@ -29,102 +88,357 @@ class LogisticRegression:
         A great explanation of cross-entropy loss can be found here:
         https://eli.thegreenplace.net/2016/the-softmax-function-and-its-derivative/
 
+        Each epoch goes once through all the training data, in mini-batches
+        taken from a new random permutation of it.
+
         Parameters:
-        - X: np.ndarray of shape (m, n) containing the training data
-        - y: np.ndarray of shape (m, k) containing the training labels
+        - X: np.ndarray or sparse matrix of shape (m, n) containing the training data
+        - y: np.ndarray of shape (m, k) or (m,) containing the training labels
         - learning_rate: float learning rate for gradient descent
         - epochs: int number of epochs to train the model
         - batch_size: int number of samples to use in each mini-batch
+        - loss_every: int number of epochs between two evaluations of the
+          loss over the whole training data
+        - lr_schedule: learning rate of each epoch, 'constant', 'time'
+          (learning_rate / (1 + decay * epoch)), 'exponential'
+          (learning_rate * exp(-decay * epoch)) or a function of the epoch
+        - decay: float decay rate of the 'time' and 'exponential' schedules
+        - validation_data: (X_val, y_val) used for early stopping
+        - validation_split: float fraction of the training data held out for
+          early stopping, if no validation_data is given
+        - patience: int number of epochs without improvement of the
+          validation loss (by more than tol) before stopping; the weights of
+          the best epoch are kept
+        - tol: float minimum improvement of the validation loss
+
+        Returns:
+        - np.ndarray containing the loss every loss_every epochs
         """
-        X = X.to_numpy() if isinstance(X, DataFrame) else X
-        y = y.to_numpy() if isinstance(y, DataFrame) else y
-        losses = np.zeros(epochs)
+        X = self._check_data(X)
+        y = self._check_labels(y)
+        schedule = self._schedule(lr_schedule, learning_rate, decay)
 
-        # Make sure the prediction shapes are correct
-        if y.ndim == 1:
-            y = y.reshape(-1, 1)
+        self._rng = None
+        self._init_params(X.shape[1], self._n_classes(y))
+
+        # Hold out part of the data to decide when to stop
+        if validation_data is None and validation_split > 0:
+            permutation = self._rng.permutation(X.shape[0])
+            n_validation = int(X.shape[0] * validation_split)
+            validation = permutation[:n_validation]
+            train = permutation[n_validation:]
+            validation_data = (X[validation], y[validation])
+            X, y = X[train], y[train]
 
-        self.weights = np.random.uniform(-0.01, 0.01, (X.shape[1], y.shape[1]))
-        self.bias = np.random.uniform(-0.01, 0.01, y.shape[1])
+        if validation_data is not None:
+            X_val = self._check_data(validation_data[0])
+            y_val = self._check_labels(validation_data[1], self._one_hot)
+            validation_losses = []
+            # the starting weights are kept if the loss never improves (or is nan)
+            best_loss, bad_epochs = np.inf, 0
+            best_params = (self.weights.copy(), self.bias.copy())
 
+        losses = []
         for epoch in range(epochs):
-            y_pred = self._forward(X)
-            loss = self._loss(y, y_pred)
-            losses[epoch] = loss
+            evaluate = epoch % loss_every == 0
+            report = verbose and epoch % 100 == 0
 
-            if verbose and epoch % 100 == 0:
+            if evaluate or report:
+                loss = self._dataset_loss(X, y)
+            if evaluate:
+                losses.append(loss)
+            if report:
                 print(f"Loss at epoch {epoch}: {loss}")
 
-            dW = np.zeros_like(self.weights)
-            db = np.zeros_like(self.bias)
+            self._epoch(X, y, schedule(epoch), batch_size)
 
-            # Compute the gradients using a mini-batch
-            batch_indices = np.random.choice(X.shape[0], batch_size, replace=False)
-            X_batch = X[batch_indices]
-            y_batch = y[batch_indices]
-            y_pred_batch = y_pred[batch_indices]
+            if validation_data is None:
+                continue
 
-            # Could be optimized by vectorizing the computation
-            # But this is easier to understand
-            for Xk, yk, yk_pred in zip(X_batch, y_batch, y_pred_batch):
-                # i is the numer of classes / independent predictions
-                # J is the number of features
-                for i in range(yk.shape[0]):
-                    for j in range(Xk.shape[0]):
-                        y_index = np.argmax(yk)
-                        dt_yi = 1 if y_index == i else 0
+            # Early stopping on the validation loss
+            validation_loss = self._dataset_loss(X_val, y_val)
+            validation_losses.append(validation_loss)
 
-                        dW[j][i] += (yk_pred[i] - dt_yi) * Xk[j]
-                        db[i] += (yk_pred[i] - dt_yi)
+            if validation_loss < best_loss - tol:
+                best_loss, bad_epochs = validation_loss, 0
+                best_params = (self.weights.copy(), self.bias.copy())
+            else:
+                bad_epochs += 1
+                if bad_epochs >= patience:
+                    if verbose:
+                        print(f"Early stopping at epoch {epoch}")
+                    break
 
-            dW /= batch_size
-            db /= batch_size
+        # stopped early or not, the weights of the best epoch are kept
+        if validation_data is not None:
+            self.weights, self.bias = best_params
+            self.validation_losses = np.array(validation_losses)
 
-            # Update the weights and bias
-            self.weights -= learning_rate * dW
-            self.bias -= learning_rate * db
+        return np.array(losses)
 
-        return losses
+    def partial_fit(
+            self,
+            X: np.ndarray,
+            y: np.ndarray,
+            learning_rate: float = 0.01,
+            batch_size: int = 32,
+            n_classes: int = None
+        ) -> "LogisticRegression":
+        """
+        Update the model with one epoch over the given data, without
+        resetting the weights nor the optimizer state; meant to train the
+        model incrementally, chunk by chunk.
+
+        Parameters:
+        - X: np.ndarray or sparse matrix of shape (m, n) containing the training data
+        - y: np.ndarray of shape (m, k) or (m,) containing the training labels
+        - learning_rate: float learning rate for gradient descent
+        - batch_size: int number of samples to use in each mini-batch
+        - n_classes: int number of classes, for class index labels; needed on
+          the first call if the first chunk may miss some classes
+        """
+        X = self._check_data(X)
+        y = self._check_labels(y)
+
+        if self.weights is None:
+            self._init_params(X.shape[1], n_classes or self._n_classes(y))
+        elif self._optimizer_state is None:
+            # A loaded model, whose weights may be read-only memory maps
+            self.weights = np.array(self.weights)
+            self.bias = np.array(self.bias)
+            self._init_rng()
+            self._init_optimizer()
+
+        self._epoch(X, y, learning_rate, batch_size)
+        return self
 
     def predict(self, X: np.ndarray) -> np.ndarray:
         """
         Predict the labels for the data.
 
         Parameters:
-        - X: np.ndarray of shape (m, n) containing the data
+        - X: np.ndarray or sparse matrix of shape (m, n) containing the data
 
         Returns:
-        - np.ndarray of shape (m, k) containing the predicted labels
+        - np.ndarray of shape (m, k) containing the predicted labels, or of
+          shape (m,) containing the predicted class indices
         """
-        X = X.to_numpy() if isinstance(X, DataFrame) else X
+        X = self._check_data(X)
         y_pred = self._forward(X)
 
+        if not self._one_hot:
+            return y_pred.argmax(1)
+
         # Avoid using np.round because it can round all values to 0
         result = np.zeros_like(y_pred)
         result[np.arange(len(y_pred)), y_pred.argmax(1)] = 1
 
         return result
-    
-    def _softmax(self, S: np.ndarray) -> np.ndarray:
+
+    def softmax(self, S: np.ndarray) -> np.ndarray:
         """
-        Compute the softmax of a vector in a numerically stable way.
+        Compute the softmax of each row of logits in a numerically stable
+        way, the class probabilities the model gives for these logits.
         """
         shiftS = S - np.max(S, axis=1, keepdims=True)
         expS = np.exp(shiftS)
         return expS / np.sum(expS, axis=1, keepdims=True)
 
+    def save(self, path: str) -> None:
+        """
+        Save the fitted model into the directory path.
+        """
+        if self.weights is None:
+            raise ValueError("Model not fitted")
+
+        params = {
+            'optimizer': self.optimizer,
+            'momentum': self.momentum,
+            'beta1': self.beta1,
+            'beta2': self.beta2,
+            'epsilon': self.epsilon,
+            'random_state': self.random_state,
+            'dtype': self.dtype.str,
+            'one_hot': self._one_hot,
+        }
+        save_arrays(path, 'LogisticRegression', params, {'weights': self.weights, 'bias': self.bias})
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> "LogisticRegression":
+        """
+        Load a model saved with save. With mmap_mode='r' the weights are
+        read-only memory maps of the files, None reads them into memory.
+        """
+        params, arrays = load_arrays(path, 'LogisticRegression', mmap_mode)
+        one_hot = params.pop('one_hot')
+
+        model = cls(**params)
+        model.weights = arrays['weights']
+        model.bias = arrays['bias']
+        model._one_hot = one_hot
+        return model
+
+    def _check_data(self, X: np.ndarray) -> np.ndarray:
+        X = X.to_numpy() if isinstance(X, DataFrame) else X
+        # Sparse matrices are sliced by rows, which CSR does best
+        if sp.issparse(X):
+            X = X.tocsr()
+        return X
+
+    def _check_labels(self, y: np.ndarray, one_hot: bool = None) -> np.ndarray:
+        """
+        Check the labels and set the label format of the model from them, or,
+        if one_hot is given, check that they have this format instead.
+        """
+        y = y.to_numpy() if isinstance(y, (DataFrame, Series)) else np.asarray(y)
+
+        # A vector holds class indices, a matrix one-hot encoded labels
+        if y.ndim == 1 and not np.issubdtype(y.dtype, np.integer):
+            raise ValueError("Labels must be a one-hot matrix or a vector of class indices")
+
+        is_one_hot = y.ndim != 1
+        if one_hot is None:
+            self._one_hot = is_one_hot
+        elif is_one_hot != one_hot:
+            expected = "one-hot matrix" if one_hot else "vector of class indices"
+            raise ValueError(f"Validation labels must be a {expected}, like the training labels")
+
+        return y if is_one_hot else y.astype(np.intp, copy=False)
+
+    def _n_classes(self, y: np.ndarray) -> int:
+        return y.shape[1] if y.ndim == 2 else int(y.max()) + 1
+
+    def _schedule(
+            self,
+            lr_schedule: str | Callable[[int], float],
+            learning_rate: float,
+            decay: float
+        ) -> Callable[[int], float]:
+        """
+        Return the function giving the learning rate of each epoch.
+        """
+        if callable(lr_schedule):
+            return lr_schedule
+        if lr_schedule == 'constant':
+            return lambda epoch: learning_rate
+        if lr_schedule == 'time':
+            return lambda epoch: learning_rate / (1 + decay * epoch)
+        if lr_schedule == 'exponential':
+            return lambda epoch: learning_rate * np.exp(-decay * epoch)
+
+        raise ValueError(f"Unknown learning rate schedule {lr_schedule}, expected one of {self.SCHEDULES}")
+
+    def _init_params(self, n_features: int, n_classes: int) -> None:
+        """
+        Initialize the weights, the bias and the optimizer state.
+        """
+        self._init_rng()
+
+        self.weights = self._rng.uniform(-0.01, 0.01, (n_features, n_classes)).astype(self.dtype)
+        self.bias = self._rng.uniform(-0.01, 0.01, n_classes).astype(self.dtype)
+        self._init_optimizer()
+
+    def _init_rng(self) -> None:
+        if self._rng is None:
+            # Seeded from the global state if no random_state is given, so
+            # np.random.seed still makes the training reproducible
+            seed = self.random_state
+            if seed is None:
+                seed = np.random.randint(2 ** 31)
+            self._rng = np.random.default_rng(seed)
+
+    def _init_optimizer(self) -> None:
+        self._steps = 0
+        self._optimizer_state = {
+            'weights': [np.zeros_like(self.weights), np.zeros_like(self.weights)],
+            'bias': [np.zeros_like(self.bias), np.zeros_like(self.bias)],
+        }
+
+    def _epoch(self, X: np.ndarray, y: np.ndarray, learning_rate: float, batch_size: int) -> None:
+        """
+        Go once through the data, in mini-batches taken in a random order.
+        """
+        permutation = self._rng.permutation(X.shape[0])
+
+        for start in range(0, X.shape[0], batch_size):
+            batch_indices = permutation[start:start + batch_size]
+            dW, db = self._gradients(X[batch_indices], y[batch_indices])
+            self._step(dW, db, learning_rate)
+
+    def _step(self, dW: np.ndarray, db: np.ndarray, learning_rate: float) -> None:
+        """
+        Update the weights and bias with the gradients of a mini-batch.
+        """
+        self._steps += 1
+        self.weights -= self._update('weights', dW, learning_rate)
+        self.bias -= self._update('bias', db, learning_rate)
+
+    def _update(self, name: str, gradient: np.ndarray, learning_rate: float) -> np.ndarray:
+        """
+        Compute the update of a parameter, according to the optimizer.
+        """
+        if self.optimizer == 'sgd':
+            return learning_rate * gradient
+
+        first, second = self._optimizer_state[name]
+        if self.optimizer == 'momentum':
+            first *= self.momentum
+            first += learning_rate * gradient
+            return first
+
+        # Adam, with bias correction of both moments
+        first *= self.beta1
+        first += (1 - self.beta1) * gradient
+        second *= self.beta2
+        second += (1 - self.beta2) * gradient ** 2
+
+        first_hat = first / (1 - self.beta1 ** self._steps)
+        second_hat = second / (1 - self.beta2 ** self._steps)
+        return learning_rate * first_hat / (np.sqrt(second_hat) + self.epsilon)
+
     def _forward(self, X: np.ndarray) -> np.ndarray:
         """
         Forward pass through the network.
         """
-        logits = np.dot(X, self.weights) + self.bias
+        X = X.astype(self.dtype, copy=False)
+        logits = X @ self.weights + self.bias
         # print(f"X: {X[:5]}")
         # print(f"Logits: {logits[:5]}")
-        return self._softmax(logits)
-    
+        return self.softmax(logits)
+
+    def _gradients(self, X: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute the gradients of the cross-entropy loss over a batch, with
+        respect to the weights and the bias. For softmax, the gradient of the
+        loss with respect to the logits is simply y_pred - y.
+        """
+        X = X.astype(self.dtype, copy=False)
+        error = self._forward(X)
+        if y.ndim == 1:
+            error[np.arange(X.shape[0]), y] -= 1
+        else:
+            error -= y
+        error /= X.shape[0]
+
+        return np.asarray(X.T @ error), error.sum(axis=0)
+
     def _loss(self, y: np.ndarray, y_pred: np.ndarray) -> float:
         """
         Compute the cross-entropy loss. For two classes, this is
         equivalent to the binary cross-entropy loss.
         """
+        if y.ndim == 1:
+            return np.mean(-np.log(y_pred[np.arange(len(y)), y] + 1e-8))
         return np.mean(-np.sum(y * np.log(y_pred + 1e-8), axis=1))
+
+    def _dataset_loss(self, X: np.ndarray, y: np.ndarray, chunk_size: int = 65536) -> float:
+        """
+        Compute the cross-entropy loss over a whole dataset, by chunks, so
+        the predictions are never held in memory all at once.
+        """
+        total = 0.0
+        for start in range(0, X.shape[0], chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            y_chunk = y[start:start + chunk_size]
+            total += self._loss(y_chunk, self._forward(X_chunk)) * X_chunk.shape[0]
+        return total / X.shape[0]
@@ -0,0 +1,45 @@
+from sklearn.metrics import classification_report
+
+import numpy as np
+
+# Hotfix to allow script to be run from anywhere
+__import__('sys').path.append('..')
+
+from preprocessing.url_features import *
+
+from logistic_regression import LogisticRegression
+
+
+def split(X, y, start):
+    # every fifth url of the dataset is kept for testing; start is the
+    # position of the chunk in the dataset
+    test = (np.arange(start, start + len(y)) % 5) == 0
+    return (X[~test], y[~test]), (X[test], y[test])
+
+
+classes = get_url_classes()
+featurizer = UrlFeaturizer(n_features=2 ** 16)
+
+# Train on 4 out of 5 urls, chunk by chunk, so memory does not depend on
+# the size of the dataset
+lr = LogisticRegression(optimizer='adam', dtype=np.float32, random_state=0)
+for epoch in range(20):
+    start = 0
+    for X, y in iter_url_dataset(chunk_size=200, featurizer=featurizer, classes=classes):
+        (X_train, y_train), _ = split(X, y, start)
+        lr.partial_fit(X_train, y_train, learning_rate=0.01, batch_size=32, n_classes=len(classes))
+        start += len(y)
+
+# Evaluate the model on the other urls
+y_test, lr_predict = [], []
+start = 0
+for X, y in iter_url_dataset(chunk_size=200, featurizer=featurizer, classes=classes):
+    _, (X_test, y_chunk) = split(X, y, start)
+    y_test.append(y_chunk)
+    lr_predict.append(lr.predict(X_test))
+    start += len(y)
+
+report = classification_report(np.concatenate(y_test), np.concatenate(lr_predict),
+                               labels=range(len(classes)), target_names=classes)
+
+print(report)
@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+
+
+def cache_dir(path):
+    """
+    Directory the cache of a source file is kept in, next to the file.
+    """
+    return os.path.join(os.path.dirname(path), '.cache', os.path.basename(path))
+
+
+def source_key(paths):
+    """
+    Identify the current version of the source files by their size and
+    modification time; if any of them changes, the cache is rebuilt.
+    """
+    key = []
+    for path in paths:
+        stat = os.stat(path)
+        key.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return key
+
+
+def _is_string(dtype):
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+
+def _save_column(path, values):
+    # string columns are stored dictionary encoded, as the codes of each row
+    # and the distinct values, which is both small and fast to load back
+    if _is_string(values.dtype):
+        codes, uniques = pd.factorize(values)
+        np.save(path, codes.astype(np.int32))
+        np.save(path.replace('.npy', '_values.npy'), np.asarray(uniques, dtype=str))
+    else:
+        np.save(path, values.to_numpy())
+
+
+def _load_column(path, dtype):
+    values = np.load(path, mmap_mode='r')
+    if not _is_string(pd.api.types.pandas_dtype(dtype)):
+        return pd.Series(values, dtype=dtype)
+
+    uniques = np.load(path.replace('.npy', '_values.npy')).astype(object)
+    return pd.Series(pd.array(uniques, dtype=dtype).take(values, allow_fill=True))
+
+
+def write_cache(directory, key, df, labels):
+    """
+    Write the frame as one .npy file per column, plus the labels and a
+    meta.json header with the source key, the column names and dtypes.
+    """
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    columns = []
+    for i, column in enumerate(df.columns):
+        _save_column(os.path.join(tmp_directory, f"column_{i}.npy"), df[column])
+        columns.append({'name': column, 'dtype': str(df[column].dtype)})
+    _save_column(os.path.join(tmp_directory, 'labels.npy'), pd.Series(labels, dtype=object))
+
+    meta = {'version': CACHE_VERSION, 'source': key, 'columns': columns}
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    # swap the new cache in place of the old one
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+
+
+def read_cache(directory, key, columns=None):
+    """
+    Read the frame and the labels from the cache, or return None if there is
+    no cache or if it does not match the key. Only the requested columns are
+    read, memory mapped.
+    """
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('version') != CACHE_VERSION or meta.get('source') != key:
+        return None
+
+    names = [column['name'] for column in meta['columns']]
+    if columns is None:
+        columns = names
+
+    data = {}
+    for column in columns:
+        i = names.index(column)
+        data[column] = _load_column(os.path.join(directory, f"column_{i}.npy"),
+                                    meta['columns'][i]['dtype'])
+
+    labels = _load_column(os.path.join(directory, 'labels.npy'), 'object')
+    return pd.DataFrame(data), labels.tolist()
+
+
+def load_cached(paths, build, columns=None):
+    """
+    Return build() -> (df, labels), parsed from the source files only when
+    they changed since the last call, otherwise read from a columnar cache.
+
+    Parameters:
+    - paths: list of the source files, the cache is kept next to the first one
+    - build: function parsing the source files into a DataFrame and labels
+    - columns: list of the columns to load, None for all of them
+    """
+    directory = cache_dir(paths[0])
+    key = source_key(paths)
+
+    cached = read_cache(directory, key, columns)
+    if cached is not None:
+        return cached
+
+    df, labels = build()
+    try:
+        write_cache(directory, key, df, labels)
+    except OSError:
+        # not being able to cache is not an error, just slower
+        pass
+
+    if columns is not None:
+        df = df[columns]
+    return df, labels
@@ -0,0 +1,160 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# "HH:MM:SS.ffffff", with the same ranges time.strptime accepts
+TIME_REGEX = re.compile(r"(2[0-3]|[0-1]\d|\d):([0-5]\d|\d):(6[0-1]|[0-5]\d|\d)\.([0-9]{1,6})")
+
+# rows parsed at once by parse_time_column
+CHUNK_SIZE = 1 << 18
+
+# the longest day count parsed by parse_time_column, so it fits in an int64
+MAX_DAYS_DIGITS = 12
+
+
+def parse_time(duration):
+    """
+    Parse a flow duration of the form "N days HH:MM:SS.ffffff" into seconds.
+
+    A value without a valid day count raises ValueError. A value with a valid
+    day count but a malformed time (a missing fraction included) is 0.
+    """
+    days, duration = duration.split(' days ')
+    days = int(days) * 86400
+
+    match = TIME_REGEX.fullmatch(duration)
+    if match is None:
+        return 0
+
+    hours, minutes, seconds, fraction = match.groups()
+    seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    miliseconds = int(fraction) / 10 ** len(fraction)
+
+    # return total number of seconds
+    return float(days) + float(seconds) + miliseconds
+
+
+def _number(digits):
+    # value of the digits on each row of a (rows, width) matrix
+    powers = 10 ** np.arange(digits.shape[1] - 1, -1, -1, dtype=np.int64)
+    return (digits.astype(np.int64) - ord('0')) @ powers
+
+
+def _is_digit(chars):
+    return ((chars >= ord('0')) & (chars <= ord('9'))).all(axis=1)
+
+
+def _parse_layout(chars, days_length, length):
+    # parse rows of the same length and with the day count of the same
+    # length, so every field is at the same columns on all of them. Returns
+    # the durations and a mask of the rows following "D days HH:MM:SS[.fff]"
+    fast = np.full(len(chars), days_length <= MAX_DAYS_DIGITS)
+    result = np.zeros(len(chars), dtype=np.float64)
+
+    # "D days HH:MM:SS" must fit in the row
+    start = days_length + 6
+    end = start + 8
+    if days_length == 0 or length < end or not fast.any():
+        return result, np.zeros(len(chars), dtype=bool)
+
+    fast &= _is_digit(chars[:, :days_length])
+    fast &= (chars[:, days_length:start] == np.frombuffer(b' days ', dtype=np.uint8)).all(axis=1)
+    for i in (0, 3, 6):
+        fast &= _is_digit(chars[:, start + i:start + i + 2])
+    fast &= (chars[:, start + 2] == ord(':')) & (chars[:, start + 5] == ord(':'))
+
+    # followed either by nothing or by a dot and digits only, strptime wants
+    # a fraction of 1 to 6 digits and the time in range, otherwise it is 0
+    if length == end:
+        return result, fast
+
+    fast &= (chars[:, end] == ord('.')) & _is_digit(chars[:, end + 1:length])
+    fraction_length = length - end - 1
+    if not 1 <= fraction_length <= 6:
+        return result, fast
+
+    hours = _number(chars[:, start:start + 2])
+    minutes = _number(chars[:, start + 3:start + 5])
+    seconds = _number(chars[:, start + 6:start + 8])
+    valid = (hours <= 23) & (minutes <= 59) & (seconds <= 61)
+
+    days = _number(chars[:, :days_length])
+    fraction = _number(chars[:, end + 1:length])
+
+    result = (days * 86400).astype(np.float64) \
+        + (hours * 3600 + minutes * 60 + seconds).astype(np.float64) \
+        + fraction / 10.0 ** fraction_length
+    result[~valid] = 0
+
+    return result, fast
+
+
+def _parse_chunk(raw):
+    # returns the durations and a mask of the rows that must go through
+    # parse_time, because they do not follow "D days HH:MM:SS[.fff...]"
+    chars = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+    lengths = np.char.str_len(raw)
+
+    # the day count goes up to the first space; rows are grouped by layout,
+    # real captures only have a handful of them
+    days_lengths = np.argmax(chars == ord(' '), axis=1)
+    layouts, groups = np.unique(days_lengths * (chars.shape[1] + 1) + lengths,
+                                return_inverse=True)
+
+    result = np.zeros(len(raw), dtype=np.float64)
+    fast = np.zeros(len(raw), dtype=bool)
+    for group, layout in enumerate(layouts):
+        rows = np.flatnonzero(groups == group)
+        days_length, length = divmod(int(layout), chars.shape[1] + 1)
+        result[rows], fast[rows] = _parse_layout(chars[rows], days_length, length)
+
+    return result, ~fast
+
+
+def parse_time_column(durations):
+    """
+    Vectorized parse_time over a whole column of durations.
+
+    The values are parsed in chunks, as fixed-width byte arrays, with NumPy
+    only. The few ones that do not follow the usual layout go through
+    parse_time, so the results (and errors) are exactly the ones of
+    parse_time.
+
+    Returns a float64 pd.Series with the same index as the durations.
+    """
+    durations = pd.Series(durations, copy=False)
+    values = durations.to_numpy(dtype=object)
+    result = np.zeros(len(values), dtype=np.float64)
+
+    for begin in range(0, len(values), CHUNK_SIZE):
+        chunk = values[begin:begin + CHUNK_SIZE]
+        try:
+            raw = chunk.astype('S')
+        except (UnicodeEncodeError, ValueError, TypeError):
+            # not plain ascii, parse everything one by one
+            raw = None
+
+        if raw is not None:
+            result[begin:begin + len(chunk)] = parse_time_bytes(raw)
+        else:
+            for i, duration in enumerate(chunk):
+                result[begin + i] = parse_time(duration)
+
+    return pd.Series(result, index=durations.index, name=durations.name)
+
+
+def parse_time_bytes(raw):
+    """
+    Vectorized parse_time over a fixed-width bytes array ('S' dtype) of
+    ascii durations, returning a float64 array.
+    """
+    if raw.dtype.itemsize > 0:
+        result, slow = _parse_chunk(raw)
+    else:
+        result, slow = np.zeros(len(raw), dtype=np.float64), np.ones(len(raw), dtype=bool)
+
+    for i in np.flatnonzero(slow):
+        result[i] = parse_time(raw[i].decode())
+
+    return result
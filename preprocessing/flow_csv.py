@@ -0,0 +1,189 @@
+import mmap
+import os
+import numpy as np
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+# bytes of the file parsed at once
+CHUNK_BYTES = 1 << 24
+
+# the ascii bytes str.rstrip strips from the end of a line
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+
+
+def gather_fields(buffer, starts, ends):
+    """
+    Copy the fields between the starts and ends offsets of a byte buffer
+    into a fixed-width bytes array ('S' dtype), one row per field.
+
+    The rows are taken from a strided view of the buffer, one row of width
+    bytes at each offset, so nothing but the result is allocated per byte.
+    """
+    lengths = ends - starts
+    width = max(int(lengths.max(initial=0)), 1)
+    chars = np.empty((len(starts), width), dtype=np.uint8)
+
+    # the rows starting less than width bytes before the end of the buffer
+    # come from a copy of its end, padded with zeros
+    base = max(len(buffer) - width + 1, 0)
+    near = starts >= base
+    if not near.all():
+        chars[~near] = sliding_window_view(buffer, width)[starts[~near]]
+    if near.any():
+        padded = np.concatenate((buffer[base:], np.zeros(width, dtype=np.uint8)))
+        chars[near] = sliding_window_view(padded, width)[starts[near] - base]
+
+    chars[np.arange(width) >= lengths[:, None]] = 0
+    return chars.view(f'S{width}').ravel()
+
+
+def strip_ends(buffer, starts, ends):
+    # right strip the lines, looking back from the end of each one: only
+    # the lines ending with a blank move, usually none or all of them by
+    # one byte for a "\r\n"
+    ends = ends.copy()
+    lines = np.flatnonzero(ends > starts)
+    while len(lines):
+        lines = lines[WHITESPACE[buffer[ends[lines] - 1]]]
+        ends[lines] -= 1
+        lines = lines[ends[lines] > starts[lines]]
+    return ends
+
+
+def split_fields(buffer, indexes):
+    """
+    Find the lines and the fields of csv records in a uint8 buffer, and
+    return the values of the fields at the given indexes on every line, as
+    fixed-width bytes arrays (None if there is no line), and whether an
+    empty line stopped the records. The lines are right stripped. A line
+    without one of the fields raises ValueError.
+
+    Besides the values, only one offset per line and per comma is kept.
+    """
+    if len(buffer) == 0:
+        return None, False
+
+    newlines = np.flatnonzero(buffer == ord('\n'))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.append(newlines, len(buffer))
+
+    # no line after the last newline
+    if buffer[-1] == ord('\n'):
+        starts, ends = starts[:-1], ends[:-1]
+    ends = strip_ends(buffer, starts, ends)
+
+    stopped = False
+    empty = np.flatnonzero(ends == starts)
+    if len(empty):
+        stopped = True
+        starts, ends = starts[:empty[0]], ends[:empty[0]]
+    if len(starts) == 0:
+        return None, stopped
+
+    # the commas of each line are commas[first:first + count]
+    commas = np.flatnonzero(buffer == ord(','))
+    first = np.searchsorted(commas, starts)
+    count = np.searchsorted(commas, ends) - first
+
+    values = []
+    for index in indexes:
+        if (count < index).any():
+            line = int(np.argmax(count < index))
+            raise ValueError(f"Line {line} has no field {index}")
+
+        field_starts = starts if index == 0 else commas[first + index - 1] + 1
+        if len(commas):
+            following = commas[np.minimum(first + index, len(commas) - 1)]
+            field_ends = np.where(count > index, following, ends)
+        else:
+            field_ends = ends
+        values.append(gather_fields(buffer, field_starts, field_ends))
+
+    return values, stopped
+
+
+class FlowCsvReader:
+    """
+    Reader of flow records in the csv format of the traffic file, over the
+    memory mapped file.
+
+    The line and field boundaries are found with NumPy searches over the
+    mapped bytes, a chunk of lines at a time, and only the requested fields
+    are copied out, as fixed-width bytes arrays: no python string is built
+    for the lines nor for the other fields. The lines are right stripped,
+    and an empty line marks the end of the records, like for the scanners.
+
+    Parameters:
+    - path: the csv file
+    - header: whether the first line holds the column names
+    - chunk_bytes: about how many bytes of lines are parsed at once
+    """
+    def __init__(self, path, header=True, chunk_bytes=CHUNK_BYTES):
+        self.path = path
+        self.header = header
+        self.chunk_bytes = chunk_bytes
+        self.columns = None
+        self.stopped = False
+
+    def iter_chunks(self, fields, begin=0, end=None):
+        """
+        Yield, for each chunk of lines, the list of the values of the fields
+        (header names or indexes) on these lines, as fixed-width bytes
+        arrays. A line without one of the fields raises ValueError.
+
+        Only the lines between the offsets begin and end of the file (line
+        starts, the end of the file by default) are read, never the header.
+        stopped tells if the last run stopped at an empty line.
+        """
+        self.stopped = False
+        with open(self.path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+
+            error = None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                position = begin
+                if self.header:
+                    header_end = mapped.find(b'\n') + 1 or len(mapped)
+                    self.columns = mapped[:header_end].decode().rstrip().split(',')
+                    position = max(position, header_end)
+                indexes = [self._index(field) for field in fields]
+                stop = len(mapped) if end is None else min(end, len(mapped))
+
+                while position < stop:
+                    chunk_end = self._chunk_end(mapped, position, stop)
+                    # the arrays over the mapping must be gone before it is
+                    # closed, only copies of the fields leave split_fields.
+                    # the traceback of an error holds the array too, so only
+                    # its message is kept, raised once the mapping is closed
+                    try:
+                        values, self.stopped = split_fields(
+                            np.frombuffer(mapped, np.uint8, chunk_end - position, position), indexes)
+                    except ValueError as e:
+                        error = str(e)
+                        break
+
+                    if values is not None:
+                        yield values
+                    if self.stopped:
+                        return
+                    position = chunk_end
+
+            if error is not None:
+                raise ValueError(error)
+
+    def _index(self, field):
+        if isinstance(field, str):
+            if self.columns is None or field not in self.columns:
+                raise ValueError(f"Unknown column {field}")
+            return self.columns.index(field)
+        return field
+
+    def _chunk_end(self, mapped, position, stop):
+        # the end of the line holding the last byte of the chunk
+        if position + self.chunk_bytes >= stop:
+            return stop
+
+        newline = mapped.find(b'\n', position + self.chunk_bytes - 1, stop)
+        return stop if newline == -1 else newline + 1
@@ -0,0 +1,102 @@
+import json
+import os
+import numpy as np
+
+from sklearn.preprocessing import StandardScaler
+
+FORMAT_VERSION = 1
+
+
+def save_arrays(path, kind, params, arrays):
+    """
+    Save a model into the directory path: one .npy file per array and a
+    meta.json header with the format version, the kind of the model, its
+    parameters and the description of its arrays. No pickle is involved:
+    object arrays (class names) are stored as unicode strings.
+
+    meta.json is written last, and every file is swapped in place once
+    complete, so a reader never sees half of a save.
+
+    Parameters:
+    - path: the directory, created if needed
+    - kind: the name of the model class, checked on load
+    - params: dict of JSON serializable parameters
+    - arrays: dict of np.ndarray by name
+    """
+    os.makedirs(path, exist_ok=True)
+
+    described = {}
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        is_object = array.dtype == object
+        if is_object:
+            array = array.astype(str)
+
+        file_name = f"{name}.npy"
+        tmp_path = os.path.join(path, f"{file_name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(tmp_path, os.path.join(path, file_name))
+
+        described[name] = {'file': file_name, 'shape': list(array.shape), 'object': is_object}
+
+    meta = {'version': FORMAT_VERSION, 'kind': kind, 'params': params, 'arrays': described}
+    tmp_path = os.path.join(path, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+
+def load_arrays(path, kind, mmap_mode='r'):
+    """
+    Load what save_arrays saved, returning the parameters and the dict of
+    arrays. With mmap_mode='r', the arrays are read-only memory maps of the
+    files, so loading costs nothing until the arrays are used, and all the
+    processes loading the same model share it in the page cache.
+
+    Raises ValueError if the directory holds another kind of model or a
+    different version of the format.
+    """
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format version {meta.get('version')}, "
+                         f"expected {FORMAT_VERSION}")
+    if meta.get('kind') != kind:
+        raise ValueError(f"{path} holds a {meta.get('kind')}, not a {kind}")
+
+    arrays = {}
+    for name, described in meta['arrays'].items():
+        # empty arrays cannot be memory mapped
+        mode = mmap_mode if np.prod(described['shape']) > 0 else None
+        array = np.load(os.path.join(path, described['file']), mmap_mode=mode, allow_pickle=False)
+        arrays[name] = array.astype(object) if described['object'] else array
+
+    return meta['params'], arrays
+
+
+def save_scaler(scaler, path):
+    # a fitted StandardScaler
+    arrays = {name: getattr(scaler, name)
+              for name in ('mean_', 'var_', 'scale_', 'n_samples_seen_', 'feature_names_in_')
+              if getattr(scaler, name, None) is not None}
+    params = {'with_mean': scaler.with_mean, 'with_std': scaler.with_std,
+              'n_features_in': int(scaler.n_features_in_)}
+    save_arrays(path, 'StandardScaler', params, arrays)
+
+
+def load_scaler(path, mmap_mode='r'):
+    params, arrays = load_arrays(path, 'StandardScaler', mmap_mode)
+
+    scaler = StandardScaler(with_mean=params['with_mean'], with_std=params['with_std'])
+    scaler.n_features_in_ = params['n_features_in']
+    for name, array in arrays.items():
+        setattr(scaler, name, array)
+
+    # sklearn either has one count for all the features or one per feature
+    if scaler.n_samples_seen_.ndim == 0:
+        scaler.n_samples_seen_ = int(scaler.n_samples_seen_)
+
+    return scaler
+
@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+
+from collections import namedtuple
+
+# a stage applies its function to every item coming from the stage before
+Stage = namedtuple('Stage', ['name', 'function'])
+
+# marks the end of the items in a queue
+DONE = object()
+
+# seconds between two checks for a failed stage while waiting on a queue
+POLL_INTERVAL = 0.1
+
+
+class StageStats:
+    """
+    Where the thread of a stage spent its time: running its function (busy),
+    waiting for an item of the stage before (starved) and waiting for room
+    in the queue of the stage after (blocked).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+
+class Pipeline:
+    """
+    Runs the reading of a source and each stage in its own thread, connected
+    by queues of at most maxsize items, so reading, parsing, scoring and
+    writing overlap while the items keep their order.
+
+    A full queue blocks the stage feeding it (backpressure), so memory stays
+    bounded by maxsize items per stage whatever the speed of each stage. The
+    threads overlap the waits on the disk and the work releasing the GIL
+    (numpy, pandas, file writes); pure python stages still take turns. The
+    stats of the last run tell the bottleneck: the busiest stage, with the
+    stages before it blocked and the ones after it starved.
+
+    Parameters:
+    - stages: list of Stage, the output of the last one is dropped
+    - maxsize: number of items each queue holds
+    """
+    def __init__(self, stages, maxsize=4):
+        self.stages = list(stages)
+        self.maxsize = maxsize
+        self.stats = None
+        self.elapsed = None
+
+        self._failed = threading.Event()
+        self._error = None
+
+    def run(self, source):
+        """
+        Feed the items of the source iterable through the stages and wait
+        for the last one. An exception in any stage stops all of them and
+        is raised again here. Returns the StageStats of the reading and of
+        each stage.
+        """
+        self._failed.clear()
+        self._error = None
+        self.stats = [StageStats('read')] + [StageStats(stage.name) for stage in self.stages]
+        queues = [queue.Queue(self.maxsize) for _ in self.stages]
+
+        threads = [threading.Thread(target=self._guard,
+                                    args=(self._read, source, queues[0], self.stats[0]))]
+        for i, stage in enumerate(self.stages):
+            output = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self._guard,
+                                            args=(self._work, stage.function, queues[i],
+                                                  output, self.stats[i + 1])))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+        return self.stats
+
+    def report(self):
+        # a table of the share of the time each stage was busy, starved and
+        # blocked during the last run
+        lines = [f"{'stage':<10} {'items':>8} {'busy':>6} {'starved':>8} {'blocked':>8}"]
+        for stats in self.stats:
+            share = [value / self.elapsed if self.elapsed else 0.0
+                     for value in (stats.busy, stats.starved, stats.blocked)]
+            lines.append(f"{stats.name:<10} {stats.items:>8} {share[0]:>6.1%} "
+                         f"{share[1]:>8.1%} {share[2]:>8.1%}")
+        return '\n'.join(lines)
+
+    def _guard(self, target, *args):
+        try:
+            target(*args)
+        except BaseException as error:
+            if self._error is None:
+                self._error = error
+            self._failed.set()
+
+    def _put(self, output, item, stats):
+        # returns False if the pipeline failed meanwhile
+        start = time.perf_counter()
+        try:
+            while not self._failed.is_set():
+                try:
+                    output.put(item, timeout=POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            stats.blocked += time.perf_counter() - start
+
+    def _get(self, input, stats):
+        # returns DONE if the pipeline failed meanwhile
+        start = time.perf_counter()
+        try:
+            while not self._failed.is_set():
+                try:
+                    return input.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            return DONE
+        finally:
+            stats.starved += time.perf_counter() - start
+
+    def _read(self, source, output, stats):
+        items = iter(source)
+        while True:
+            start = time.perf_counter()
+            item = next(items, DONE)
+            stats.busy += time.perf_counter() - start
+
+            if item is DONE:
+                break
+            stats.items += 1
+            if not self._put(output, item, stats):
+                return
+
+        self._put(output, DONE, stats)
+
+    def _work(self, function, input, output, stats):
+        while True:
+            item = self._get(input, stats)
+            if item is DONE:
+                break
+
+            start = time.perf_counter()
+            result = function(item)
+            stats.busy += time.perf_counter() - start
+            stats.items += 1
+
+            if output is not None and not self._put(output, result, stats):
+                return
+
+        if output is not None:
+            self._put(output, DONE, stats)
@@ -0,0 +1,146 @@
+import itertools
+import math
+import numpy as np
+import scipy.sparse as sp
+
+from collections import Counter
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+URL_DATASET = '../data/url_dataset/urls.in'
+URL_LABELS = '../data/url_dataset/urls_classes'
+
+# lexical features of each url, after the hashed ones
+LEXICAL_FEATURES = ['length', 'host_length', 'path_length', 'entropy', 'digit_ratio',
+                    'special_ratio', 'host_dots', 'port_or_credentials', 'has_query']
+
+
+def split_url(url):
+    """
+    Split an url into its host, its path (without the query and the fragment)
+    and the extension of the last path segment ('' if none).
+    """
+    url = url.split('://')[-1]
+    host, slash, path = url.partition('/')
+    path = slash + path.split('?')[0].split('#')[0]
+
+    last_segment = path.rsplit('/', 1)[-1]
+    extension = last_segment.rsplit('.', 1)[-1].lower() if '.' in last_segment else ''
+
+    return host, path, extension
+
+
+def shannon_entropy(text):
+    counts = Counter(text).values()
+    return -sum(count / len(text) * math.log2(count / len(text)) for count in counts)
+
+
+def lexical_features(url):
+    host, path, extension = split_url(url)
+    length = max(len(url), 1)
+
+    return [
+        math.log1p(len(url)),
+        math.log1p(len(host)),
+        math.log1p(len(path)),
+        shannon_entropy(url),
+        sum(char.isdigit() for char in url) / length,
+        sum(not char.isalnum() for char in url) / length,
+        host.count('.'),
+        float(':' in host or '@' in host),
+        float('?' in url),
+    ]
+
+
+class UrlFeaturizer(BaseEstimator, TransformerMixin):
+    """
+    Transformer that encodes urls into a sparse matrix of lexical features,
+    without any state, so any number of urls can be featurized chunk by chunk
+    with the same columns.
+
+    Parameters:
+    - n_features: number of hashed character n-gram columns
+    - ngram_range: (min, max) length of the character n-grams
+    - n_token_features: number of hashed top level domain and path
+      extension columns
+    - dtype: dtype of the matrix
+
+    The columns are the hashed n-grams of the lowercased url (l2 normalized),
+    then the hashed 'tld=...' and 'ext=...' tokens, then LEXICAL_FEATURES.
+    """
+    def __init__(self, n_features=2 ** 18, ngram_range=(3, 5), n_token_features=2 ** 10,
+                 dtype=np.float32):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.n_token_features = n_token_features
+        self.dtype = dtype
+
+    def fit(self, X=None, y=None):
+        return self
+
+    def transform(self, X):
+        urls = [str(url) for url in X]
+
+        ngrams = HashingVectorizer(analyzer='char', ngram_range=self.ngram_range,
+                                   n_features=self.n_features, alternate_sign=False,
+                                   dtype=self.dtype).transform(urls)
+
+        tokens = []
+        for url in urls:
+            host, path, extension = split_url(url)
+            tokens.append([f"tld={host.rsplit('.', 1)[-1].lower()}", f"ext={extension}"])
+        tokens = FeatureHasher(n_features=self.n_token_features, input_type='string',
+                               alternate_sign=False, dtype=self.dtype).transform(tokens)
+
+        lexical = sp.csr_matrix(np.array([lexical_features(url) for url in urls],
+                                         dtype=self.dtype).reshape(len(urls), len(LEXICAL_FEATURES)))
+
+        return sp.hstack([ngrams, tokens, lexical], format='csr', dtype=self.dtype)
+
+
+def iter_url_dataset(chunk_size=100_000, featurizer=None, classes=None):
+    """
+    Yield the url dataset as featurized (X_chunk, y_chunk) blocks of at most
+    chunk_size rows, X_chunk being a scipy.sparse CSR matrix, reading the
+    urls and the labels files in lockstep, so memory stays bounded whatever
+    the size of the dataset. An empty line marks the end of the urls.
+
+    Parameters:
+    - chunk_size: number of rows of each block
+    - featurizer: the UrlFeaturizer, None for the default one
+    - classes: list of the class names; if given, y_chunk holds the index of
+      each label in it, otherwise the label strings
+    """
+    featurizer = UrlFeaturizer() if featurizer is None else featurizer
+    label_index = None if classes is None else {label: i for i, label in enumerate(classes)}
+
+    with open(URL_DATASET, 'r') as urls_file, open(URL_LABELS, 'r') as labels_file:
+        while True:
+            urls = [url.rstrip() for url in itertools.islice(urls_file, chunk_size)]
+            stopped = '' in urls
+            if stopped:
+                urls = urls[:urls.index('')]
+            if not urls:
+                break
+
+            labels = [label.strip() for label in itertools.islice(labels_file, len(urls))]
+            if len(labels) != len(urls):
+                raise ValueError("The urls and the labels files have a different number of rows")
+
+            if label_index is None:
+                y = np.array(labels, dtype=object)
+            else:
+                y = np.array([label_index[label] for label in labels], dtype=np.int16)
+
+            yield featurizer.transform(urls), y
+
+            if stopped:
+                break
+
+
+def get_url_classes():
+    # the distinct labels of the url dataset, sorted
+    with open(URL_LABELS, 'r') as file:
+        return sorted({label.strip() for label in file if label.strip()})
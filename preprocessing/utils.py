@@ -1,73 +1,277 @@
-import pandas as pd
-import time
-
-from datetime import timedelta
-from sklearn.base import BaseEstimator, TransformerMixin
-
-
-def parse_time(duration):
-    days, duration = duration.split(' days ')
-    days = int(days) * 86400
-    try:
-        t_struct = time.strptime(duration, '%H:%M:%S.%f')
-        seconds = timedelta(hours=t_struct.tm_hour, minutes=t_struct.tm_min,
-                            seconds=t_struct.tm_sec).total_seconds()
-        miliseconds = 0
-        if '.' in duration:
-            miliseconds = float(f"0.{duration.split('.')[1]}")
-    except Exception as e:
-        return 0
-
-    # return total number of seconds
-    return float(days) + seconds + miliseconds
-
-
-def get_network_labels():
-    with open('../data/network_dataset/traffic_classes', 'r') as file:
-        labels = [label.strip() for label in file.readlines()]
-    return labels[1:]
-
-
-def load_network_dataset():
-    # Load the dataset
-    df = pd.read_csv('../data/network_dataset/traffic.in')
-    df['flow_duration'] = df['flow_duration'].apply(parse_time)
-    df['origin_ip'] = df['origin_ip'].astype('string')
-    df['response_ip'] = df['response_ip'].astype('string')
-
-    # Load the labels
-    labels = get_network_labels()
-
-    return df, labels
-
-
-class IPTransformer(BaseEstimator, TransformerMixin):
-    def __init__(self, columns=None):
-        self.columns = columns
-        pass
-
-    def fit(self, X, y=None):
-        return self
-
-    def transform(self, X):
-        # Split the IPv4 address fields into 4 parts
-        # Each part will be a separate column in the dataframe
-        # But first, we must check if the ip is v4 or v6
-
-        for column in self.columns:
-            ipv6_column = column + '_ipv6'
-            X[ipv6_column] = X[column].str.contains(':')
-            X[ipv6_column] = X[ipv6_column].astype('int')
-
-            new_columns = [f"{column}_{i}" for i in range(4)]
-            X[new_columns] = X[column].apply(
-                lambda x: 
-                    pd.Series(str(x).split('.')) if '.' in x else pd.Series([0, 0, 0, 0])
-            )
-
-            X[new_columns] = X[new_columns].astype('int')
-
-        # Drop the original columns
-        X.drop(self.columns, axis=1, inplace=True)
-
-        return X
+import os
+import numpy as np
+import pandas as pd
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from preprocessing.cache import load_cached
+from preprocessing.durations import parse_time, parse_time_column
+from preprocessing.serialization import load_arrays, save_arrays
+
+
+NETWORK_DATASET = '../data/network_dataset/traffic.in'
+NETWORK_LABELS = '../data/network_dataset/traffic_classes'
+IP_FIELDS = ['origin_ip', 'response_ip']
+
+# columns read as strings, the others are numbers
+STRING_FIELDS = IP_FIELDS + ['flow_duration']
+
+
+def get_network_labels():
+    with open(NETWORK_LABELS, 'r') as file:
+        labels = [label.strip() for label in file.readlines()]
+    return labels[1:]
+
+
+def parse_network_dataset():
+    # Load the dataset
+    df = pd.read_csv(NETWORK_DATASET)
+    df['flow_duration'] = parse_time_column(df['flow_duration'])
+    df['origin_ip'] = df['origin_ip'].astype('string')
+    df['response_ip'] = df['response_ip'].astype('string')
+
+    # Load the labels
+    labels = get_network_labels()
+
+    return df, labels
+
+
+def get_network_columns():
+    # the header of the traffic file, found from this module, so it works
+    # from any directory: data/ is a sibling of preprocessing/ too
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), NETWORK_DATASET), 'r') as file:
+        return file.readline().strip().split(',')
+
+
+def load_network_dataset(columns=None, cache=True):
+    """
+    Load the network dataset and its labels.
+
+    The parsed dataset is cached next to the source files and only parsed
+    again when they change, see preprocessing.cache.
+
+    Parameters:
+    - columns: list of the columns to load, None for all of them
+    - cache: set to False to always parse the source files
+    """
+    if not cache:
+        df, labels = parse_network_dataset()
+        return (df if columns is None else df[columns]), labels
+
+    return load_cached([NETWORK_DATASET, NETWORK_LABELS], parse_network_dataset, columns)
+
+
+def pack_ipv4(ips):
+    """
+    Pack IPv4 addresses into a np.uint32 array. Anything that is not an IPv4
+    address (IPv6 ones and missing values included) is packed as 0.
+
+    Each distinct address is parsed only once, which makes this fast on
+    network captures, where the same addresses appear over and over.
+    """
+    ips = pd.Series(ips, copy=False).astype('str')
+    codes, uniques = pd.factorize(ips)
+
+    # missing ips get the code -1, which picks the extra 0 at the end
+    packed = np.zeros(len(uniques) + 1, dtype=np.uint32)
+    for i, ip in enumerate(uniques.tolist()):
+        if '.' not in ip or ':' in ip:
+            continue
+
+        octets = ip.split('.')
+        if len(octets) != 4:
+            raise ValueError(f"Invalid IPv4 address {ip}")
+
+        value = 0
+        for octet in octets:
+            octet = int(octet)
+            if not 0 <= octet <= 255:
+                raise ValueError(f"Invalid IPv4 address {ip}")
+            value = (value << 8) | octet
+        packed[i] = value
+
+    return packed[codes]
+
+
+class IPTransformer(BaseEstimator, TransformerMixin):
+    """
+    Transformer that encodes ip address columns into integer columns.
+
+    Parameters:
+    - columns: list of the ip columns to encode
+    - encoding: how IPv4 addresses are encoded
+        - 'octets': 4 uint8 columns, {column}_0 to {column}_3, one per octet
+        - 'integer': a single uint32 column, {column}_int
+        - 'prefix': the /16 and /24 networks, {column}_16 (uint16) and
+          {column}_24 (uint32)
+
+    Every ip column also gets a {column}_ipv6 flag column. IPv6 addresses
+    are encoded as 0. The other columns of X are kept as they are, and X
+    itself is never modified.
+    """
+    ENCODINGS = ('octets', 'integer', 'prefix')
+
+    def __init__(self, columns=None, encoding='octets'):
+        self.columns = columns
+        self.encoding = encoding
+
+    def fit(self, X, y=None):
+        if self.encoding not in self.ENCODINGS:
+            raise ValueError(f"Unknown encoding {self.encoding}, expected one of {self.ENCODINGS}")
+        return self
+
+    def save(self, path):
+        # see preprocessing/serialization.py; there is nothing learned, only
+        # the parameters are saved
+        save_arrays(path, 'IPTransformer', {'columns': list(self.columns), 'encoding': self.encoding}, {})
+
+    @classmethod
+    def load(cls, path):
+        params, arrays = load_arrays(path, 'IPTransformer')
+        return cls(params['columns'], params['encoding']).fit(None)
+
+    def get_feature_names_out(self, input_features=None):
+        if input_features is None:
+            input_features = self.columns
+
+        names = [name for name in input_features if name not in self.columns]
+        for column in self.columns:
+            names += self._encoded_names(column)
+
+        return np.array(names, dtype=object)
+
+    def _encoded_names(self, column):
+        # the names of the columns encode_ips gives for an ip column
+        if self.encoding == 'octets':
+            return [f"{column}_ipv6"] + [f"{column}_{i}" for i in range(4)]
+        if self.encoding == 'integer':
+            return [f"{column}_ipv6", f"{column}_int"]
+        return [f"{column}_ipv6", f"{column}_16", f"{column}_24"]
+
+    def transform(self, X):
+        self.fit(X)
+        encoded = {}
+
+        for column in self.columns:
+            names = self._encoded_names(column)
+            for name, values in zip(names, encode_ips(X[column], self.encoding)):
+                encoded[name] = values
+
+        # Keep the other columns and drop the original ones
+        encoded = pd.DataFrame(encoded, index=X.index)
+        return pd.concat([X.drop(columns=self.columns), encoded], axis=1)
+
+
+def encode_ips(ips, encoding='octets'):
+    """
+    Encode ip addresses into the columns IPTransformer gives for one ip
+    column, as a list of arrays: the ipv6 flag, then the IPv4 encoding.
+    """
+    ips = np.asarray(pd.Series(ips, copy=False).astype('str'), dtype=str)
+    columns = [(np.char.find(ips, ':') >= 0).astype(np.uint8)]
+
+    packed = pack_ipv4(ips)
+    if encoding == 'octets':
+        columns += [(packed >> (24 - 8 * i)).astype(np.uint8) for i in range(4)]
+    elif encoding == 'integer':
+        columns.append(packed)
+    else:
+        columns += [(packed >> 16).astype(np.uint16), packed >> 8]
+
+    return columns
+
+
+def network_features(df, ip_transformer, dtype=np.float64):
+    """
+    Featurize a parsed traffic frame into a 2D array: the encoded ip columns
+    first, then all the other columns, the same layout a ColumnTransformer
+    with the ip_transformer and remainder='passthrough' gives.
+    """
+    ips = ip_transformer.transform(df[ip_transformer.columns])
+    rest = df.drop(columns=ip_transformer.columns)
+
+    X = np.empty((len(df), ips.shape[1] + rest.shape[1]), dtype=dtype)
+    X[:, :ips.shape[1]] = ips.to_numpy()
+    X[:, ips.shape[1]:] = rest.to_numpy()
+    return X
+
+
+def integer_dtype(values):
+    # the smallest of int16 and int32 holding all the values of an integer
+    # feature, float64 (exact below 2 ** 53) if neither does
+    if len(values) == 0:
+        return np.dtype(np.int16)
+
+    low, high = values.min(), values.max()
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.float64)
+
+
+def iter_network_dataset(chunk_size=100_000, dtype=None, classes=None,
+                         encoding='octets', columns=None):
+    """
+    Yield the network dataset as featurized (X_chunk, y_chunk) NumPy blocks
+    of at most chunk_size rows, reading the traffic and the labels files in
+    lockstep, so memory stays bounded whatever the size of the dataset. The
+    features are the ones network_features gives.
+
+    By default the dtype of X_chunk is chosen from its columns, so that it
+    holds every value exactly: float columns (durations, averages) are
+    float64, integer ones (ports, counts, encoded ips) int16 or int32 if all
+    their values in the chunk fit, and X_chunk gets the smallest dtype
+    holding all of them. Only a selection of integer columns is downcast,
+    and the dtype can then differ between chunks.
+
+    Parameters:
+    - chunk_size: number of rows of each block
+    - dtype: dtype of X_chunk instead, which may round the values (float32
+      is exact for integers below 2 ** 24 only)
+    - classes: list of the class names; if given, y_chunk holds the index of
+      each label in it, as int16, otherwise the label strings
+    - encoding: ip encoding, see IPTransformer
+    - columns: the columns of the traffic file to featurize, all by default
+    """
+    usecols = None if columns is None else list(columns)
+    ip_columns = [column for column in IP_FIELDS if usecols is None or column in usecols]
+    ip_transformer = IPTransformer(ip_columns, encoding).fit(None)
+    string_columns = {column: str for column in STRING_FIELDS}
+
+    label_index = None
+    if classes is not None:
+        label_dtype = np.int16 if len(classes) <= np.iinfo(np.int16).max else np.int32
+        label_index = {label: i for i, label in enumerate(classes)}
+
+    frames = pd.read_csv(NETWORK_DATASET, chunksize=chunk_size, dtype=string_columns,
+                         usecols=usecols)
+    labels = pd.read_csv(NETWORK_LABELS, chunksize=chunk_size, dtype=str)
+
+    for df, y in zip(frames, labels, strict=True):
+        y = y.iloc[:, 0].str.strip()
+        if len(y) != len(df):
+            raise ValueError("The traffic and the labels files have a different number of rows")
+
+        if usecols is not None:
+            df = df[usecols]
+        if 'flow_duration' in df:
+            df['flow_duration'] = parse_time_column(df['flow_duration'])
+
+        # float64 holds the integers of the dataset exactly
+        X = network_features(df, ip_transformer)
+        if dtype is not None:
+            X = X.astype(dtype, copy=False)
+        else:
+            # the encoded ips come first, then the other columns in order
+            n_ips = X.shape[1] - (df.shape[1] - len(ip_columns))
+            rest = df.drop(columns=ip_columns)
+            integer = [True] * n_ips + [rest[column].dtype.kind in 'iub' for column in rest]
+            X = X.astype(np.result_type(*[integer_dtype(X[:, i]) if is_integer else np.float64
+                                          for i, is_integer in enumerate(integer)]), copy=False)
+
+        if label_index is None:
+            y = y.to_numpy(dtype=object)
+        else:
+            y = np.array([label_index[label] for label in y], dtype=label_dtype)
+
+        yield X, y
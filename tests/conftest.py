@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the packages are imported from the root, the scanners from base/, like
+# the scripts do with their path hotfix
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'base')]
+
+
+@pytest.fixture
+def in_base(monkeypatch):
+    # the scanners open the datasets relative to base/
+    monkeypatch.chdir(os.path.join(ROOT, 'base'))
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from batch import scan_batch
+from my_av import URLS_FILE, UrlScanner
+
+# urls parse_urls cannot slice, which scan_batch leaves to parse_url
+EDGE_URLS = [
+    # the host repeated in the path or the query
+    'example.com/example.com/index.html',
+    'http://evil.net/login?next=evil.net',
+    'paypal.com/paypal.com/a.exe',
+    # several ? or #
+    'site.org/a?b=1?c=2',
+    'site.org/page#one#two',
+    'site.org/a?b=1#c?d',
+    'site.org/~me/a?b=1?c=2',
+    # a # before the ?
+    'site.org/page#frag?query=1',
+    'http://secure.site.org/#x?paypal',
+    'bank.org/wp-admin#x?y',
+    # a host without a dot, decided before its main domain is needed
+    'localhost/setup.exe',
+    'http://localhost:8080/~user/file.sh',
+    # and a few simple ones
+    'google.com/search?q=1#top',
+    'goog1e.com/',
+    'https://user@bank.com/',
+]
+
+
+@pytest.fixture
+def scanner(in_base):
+    return UrlScanner()
+
+
+def explain_all(scanner, urls):
+    return [scanner.explain(url) for url in urls]
+
+
+def test_scan_batch_matches_scan_url(scanner):
+    with open(URLS_FILE) as urls_file:
+        urls = [url.rstrip() for url in urls_file if url.strip()]
+    urls += EDGE_URLS + EDGE_URLS[::2]
+
+    verdicts, fired = scan_batch(scanner, urls)
+
+    assert verdicts.tolist() == [scanner.scan_url(url) for url in urls]
+    assert list(zip(verdicts.tolist(), fired.tolist())) == explain_all(scanner, urls)
+
+
+def test_scan_batch_counts_hits(scanner):
+    urls = EDGE_URLS * 3
+    scan_batch(scanner, urls)
+    batch_hits = dict(scanner.rules.hits)
+
+    one_by_one = UrlScanner()
+    explain_all(one_by_one, urls)
+    assert batch_hits == one_by_one.rules.hits
+
+
+def test_host_without_dot_fails_like_scan_url(scanner):
+    # without a main domain, the whitelist rule cannot be evaluated
+    with pytest.raises(IndexError):
+        scanner.scan_url('localhost/index.html')
+    with pytest.raises(IndexError):
+        scan_batch(scanner, ['example.com/', 'localhost/index.html'])
+
+
+def test_scan_batch_empty(scanner):
+    verdicts, fired = scan_batch(scanner, [])
+    assert verdicts.dtype == np.int8 and len(verdicts) == 0 and len(fired) == 0
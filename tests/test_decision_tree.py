@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from decision_tree.decision_tree import DecisionTree, DecisionTreeNode, histogram_entropy
+from decision_tree.random_forest import RandomForest
+
+
+def test_unfitted_tree_raises():
+    with pytest.raises(ValueError, match="not fitted"):
+        DecisionTree().predict(np.zeros((2, 3)))
+
+
+@pytest.mark.parametrize('method', ['predict', 'predict_proba'])
+def test_tree_without_nodes_raises(method):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(20, 3))
+    y = (X[:, 0] > 0).astype(int)
+
+    tree = DecisionTree(max_depth=0)
+    tree.fit(X, y)
+
+    with pytest.raises(ValueError, match="max_depth"):
+        getattr(tree, method)(X)
+
+
+def make_dataset(seed, m=300, n=8, classes=3):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(m, n))
+    X[:, 0] = rng.integers(0, 5, size=m)
+    y = (X[:, 0] + X[:, 1] * 2 + rng.normal(scale=0.5, size=m)).round().astype(int) % classes
+    return X, y
+
+
+def tree_arrays(tree):
+    return [tree.feature_, tree.threshold_, tree.left_, tree.right_, tree.value_]
+
+
+def assert_same_tree(tree, other):
+    for array, other_array in zip(tree_arrays(tree), tree_arrays(other)):
+        np.testing.assert_array_equal(array, other_array)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('params', [{}, {'max_bins': 16}, {'max_features': 'sqrt', 'random_state': 0}])
+def test_n_jobs_builds_the_same_tree(seed, params):
+    X, y = make_dataset(seed)
+
+    sequential = DecisionTree(max_depth=6, min_info_gain=0.01, n_jobs=1, **params)
+    sequential.fit(X, y)
+    threaded = DecisionTree(max_depth=6, min_info_gain=0.01, n_jobs=4, **params)
+    threaded.fit(X, y)
+
+    assert len(sequential.feature_) > 7
+    assert_same_tree(sequential, threaded)
+    np.testing.assert_array_equal(sequential.predict(X), threaded.predict(X))
+
+
+def test_failed_fit_leaves_no_executor(monkeypatch):
+    X, y = make_dataset(0)
+    tree = DecisionTree(n_jobs=2)
+
+    def fail(*args):
+        raise MemoryError
+    monkeypatch.setattr(tree, '_build_tree', fail)
+    with pytest.raises(MemoryError):
+        tree.fit(X, y)
+    assert tree._executor is None
+
+    monkeypatch.undo()
+    tree.fit(X, y)
+    assert tree._executor is None
+    assert len(tree.predict(X)) == len(y)
+
+
+class RecursiveTree(DecisionTree):
+    # the recursive builder the stack one replaced, copying the rows of each
+    # node into its children
+    def _build_tree(self, X, y, depth=0):
+        if depth == self.max_depth or len(y) == 0:
+            return None
+
+        column, value, entropy = self._best_split(X, y, np.arange(len(y)))
+        counts = np.bincount(y, minlength=len(self.classes_))
+        gain = float(histogram_entropy(counts)) - entropy
+
+        node = DecisionTreeNode()
+        node.entropy = entropy
+        node.column = column
+        node.split_value = self.thresholds_[column][value]
+        node.probs = {self.classes_[c]: counts[c] / len(y) for c in np.flatnonzero(counts)}
+        node.prediction = self.classes_[np.argmax(counts)]
+
+        if gain < self.min_info_gain or entropy == 0:
+            return node
+
+        mask = X[:, column] <= value
+        node.left = self._build_tree(X[mask], y[mask], depth + 1)
+        node.right = self._build_tree(X[~mask], y[~mask], depth + 1)
+        return node
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('params', [
+    {},
+    {'max_depth': 12, 'min_info_gain': 0},
+    {'max_bins': 8},
+    {'max_features': 0.5, 'random_state': 1},
+])
+def test_stack_builder_matches_recursive_builder(seed, params):
+    X, y = make_dataset(seed)
+    params = {'max_depth': 6, 'min_info_gain': 0.01, **params}
+
+    tree = DecisionTree(**params)
+    tree.fit(X, y)
+    recursive = RecursiveTree(**params)
+    recursive.fit(X, y)
+
+    assert len(tree.feature_) > 7
+    assert_same_tree(tree, recursive)
+    np.testing.assert_array_equal(tree.predict(X), recursive.predict(X))
+    np.testing.assert_array_equal(tree.predict_proba(X), recursive.predict_proba(X))
+
+
+@pytest.mark.parametrize('labels', [299, 301])
+def test_fit_rejects_labels_of_another_length(labels):
+    X, y = make_dataset(0)
+    y = np.resize(y, labels)
+
+    with pytest.raises(ValueError, match="labels"):
+        DecisionTree().fit(X, y)
+    with pytest.raises(ValueError, match="labels"):
+        RandomForest(n_estimators=2).fit(X, y)
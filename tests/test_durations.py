@@ -0,0 +1,111 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.durations import parse_time, parse_time_bytes, parse_time_column
+
+
+def baseline_parse_time(duration):
+    # the strptime parser the scanner and the loaders used to share
+    days, duration = duration.split(' days ')
+    days = int(days) * 86400
+    try:
+        t_struct = time.strptime(duration, '%H:%M:%S.%f')
+        seconds = timedelta(hours=t_struct.tm_hour, minutes=t_struct.tm_min,
+                            seconds=t_struct.tm_sec).total_seconds()
+        miliseconds = 0
+        if '.' in duration:
+            miliseconds = float(f"0.{duration.split('.')[1]}")
+    except Exception as e:
+        return 0
+
+    return float(days) + seconds + miliseconds
+
+
+DURATIONS = [
+    # the usual layout, with every unit
+    '0 days 00:00:00.005820',
+    '0 days 00:00:01.5',
+    '0 days 00:01:00.000001',
+    '0 days 01:00:00.123456',
+    '3 days 23:59:59.999999',
+    '12 days 10:20:30.4',
+    '123456789 days 00:00:00.1',
+    # fields without their leading zero, leap seconds
+    '0 days 1:2:3.4',
+    '0 days 00:00:60.5',
+    '0 days 00:00:61.5',
+    # malformed times are 0
+    '0 days 00:00:00',
+    '1 days 00:00:05',
+    '0 days 00:00:00.',
+    '0 days 00:00:00.1234567',
+    '0 days 24:00:00.1',
+    '0 days 00:60:00.1',
+    '0 days 00:00:62.1',
+    '0 days 00:00.5',
+    '0 days aa:00:00.5',
+    '0 days 00:00:00.5x',
+    '0 days 00:00:00.5 ',
+    '0 days ',
+    # day counts int() accepts but the fast path does not
+    '-1 days 00:00:01.5',
+    '+2 days 00:00:01.5',
+    ' 4 days 00:00:01.5',
+    '0000000000000000001 days 00:00:01.5',
+]
+
+INVALID = [
+    '',
+    '00:00:00.5',
+    'x days 00:00:01.5',
+    '1 day 00:00:01.5',
+    '1 days 00:00:01.5 days 1',
+]
+
+
+@pytest.mark.parametrize('duration', DURATIONS)
+def test_parse_time_matches_baseline(duration):
+    assert parse_time(duration) == baseline_parse_time(duration)
+
+
+@pytest.mark.parametrize('duration', INVALID)
+def test_parse_time_rejects_day_counts(duration):
+    with pytest.raises(ValueError):
+        baseline_parse_time(duration)
+    with pytest.raises(ValueError):
+        parse_time(duration)
+    with pytest.raises(ValueError):
+        parse_time_column(['0 days 00:00:01.5', duration])
+    with pytest.raises(ValueError):
+        parse_time_bytes(np.array(['0 days 00:00:01.5', duration], dtype='S'))
+
+
+def test_vectorized_parsers_match_baseline():
+    # every layout mixed in one column, several times
+    durations = DURATIONS * 3
+    expected = [baseline_parse_time(duration) for duration in durations]
+
+    column = parse_time_column(pd.Series(durations, index=np.arange(len(durations)) * 2, name='d'))
+    assert column.tolist() == expected
+    assert column.index.tolist() == (np.arange(len(durations)) * 2).tolist()
+    assert column.name == 'd'
+
+    assert parse_time_bytes(np.array(durations, dtype='S')).tolist() == expected
+
+
+def test_parse_time_column_in_chunks(monkeypatch):
+    import preprocessing.durations as durations_module
+    monkeypatch.setattr(durations_module, 'CHUNK_SIZE', 4)
+
+    durations = DURATIONS + ['0 days 00:00:01.5 é']
+    expected = [baseline_parse_time(duration) for duration in durations]
+    assert parse_time_column(durations).tolist() == expected
+
+
+def test_empty():
+    assert parse_time_column([]).tolist() == []
+    assert parse_time_bytes(np.array([], dtype='S1')).tolist() == []
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from preprocessing.flow_csv import FlowCsvReader
+
+TRAFFIC_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'network_dataset', 'traffic.in')
+
+
+def test_reads_fields(tmp_path):
+    path = tmp_path / 'flows.csv'
+    path.write_bytes(b'a,b,c\n1,2,3\n4,5,6 \n\n7,8,9\n')
+
+    chunks = list(FlowCsvReader(path).iter_chunks(['c', 0]))
+    assert len(chunks) == 1
+    assert chunks[0][0].tolist() == [b'3', b'6']
+    assert chunks[0][1].tolist() == [b'1', b'4']
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 1 << 20])
+def test_short_line_raises_value_error(tmp_path, chunk_bytes):
+    # the error must not turn into a BufferError when the mapping closes
+    path = tmp_path / 'flows.csv'
+    path.write_bytes(b'a,b,c\n1,2,3\n4,5\n')
+
+    with pytest.raises(ValueError, match="has no field 2"):
+        list(FlowCsvReader(path, chunk_bytes=chunk_bytes).iter_chunks([2]))
+
+
+def test_scanner_short_flow_raises_value_error(tmp_path):
+    from my_av import TrafficScanner
+
+    header = ','.join(f"field{i}" for i in range(20))
+    path = tmp_path / 'traffic.in'
+    path.write_text(f"{header}\n1.2.3.4,1,5.6.7.8,2,0 days 00:00:01\n")
+
+    with pytest.raises(ValueError):
+        TrafficScanner().scan_file(path, tmp_path / 'traffic.out')
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n', ' \n'])
+def test_fields_match_split(tmp_path, newline):
+    with open(TRAFFIC_FILE) as traffic_file:
+        header = traffic_file.readline()
+        packets = [packet.rstrip() for packet in traffic_file if packet.strip()]
+    path = tmp_path / 'traffic.in'
+    path.write_bytes((header + ''.join(packet + newline for packet in packets)).encode())
+
+    fields = [4, 16, 0, 2]
+    chunks = list(FlowCsvReader(path, chunk_bytes=4096).iter_chunks(fields))
+
+    assert len(chunks) > 1
+    for i, field in enumerate(fields):
+        values = [value.decode() for chunk in chunks for value in chunk[i].tolist()]
+        assert values == [packet.split(',')[field] for packet in packets]
@@ -0,0 +1,24 @@
+import os
+import socket
+
+from inference.flow_service import remove_socket
+
+
+def test_remove_socket(tmp_path):
+    path = str(tmp_path / 'flows.sock')
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(path)
+    server.close()
+
+    remove_socket(path)
+    assert not os.path.exists(path)
+    # already gone
+    remove_socket(path)
+
+
+def test_remove_socket_keeps_other_files(tmp_path):
+    path = tmp_path / 'flows.sock'
+    path.write_text('not a socket')
+
+    remove_socket(str(path))
+    assert path.read_text() == 'not a socket'
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from logistic_regression.logistic_regression import LogisticRegression
+
+
+def finite_differences(model, X, y, epsilon=1e-6):
+    # central differences of the mean cross-entropy loss, without the 1e-8
+    # _loss adds inside the log, which the analytic gradients ignore
+    def loss():
+        y_pred = model._forward(X)
+        if y.ndim == 1:
+            return np.mean(-np.log(y_pred[np.arange(len(y)), y]))
+        return np.mean(-np.sum(y * np.log(y_pred), axis=1))
+
+    gradients = []
+    for params in (model.weights, model.bias):
+        gradient = np.zeros_like(params)
+        for index in np.ndindex(params.shape):
+            value = params[index]
+            params[index] = value + epsilon
+            plus = loss()
+            params[index] = value - epsilon
+            minus = loss()
+            params[index] = value
+            gradient[index] = (plus - minus) / (2 * epsilon)
+        gradients.append(gradient)
+
+    return gradients
+
+
+@pytest.mark.parametrize('one_hot', [True, False])
+def test_gradients_match_finite_differences(one_hot):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(20, 5))
+    y = rng.integers(0, 3, size=20)
+    if one_hot:
+        y = np.eye(3)[y]
+
+    model = LogisticRegression(random_state=0)
+    y = model._check_labels(y)
+    model._init_params(X.shape[1], 3)
+    # weights big enough for the softmax to be far from uniform
+    model.weights[:] = rng.normal(size=model.weights.shape)
+    model.bias[:] = rng.normal(size=model.bias.shape)
+
+    dW, db = model._gradients(X, y)
+    expected_dW, expected_db = finite_differences(model, X, y)
+
+    np.testing.assert_allclose(dW, expected_dW, rtol=1e-5, atol=1e-7)
+    np.testing.assert_allclose(db, expected_db, rtol=1e-5, atol=1e-7)
+
+
+def classification_data(rng, m=200):
+    X = rng.normal(size=(m, 4))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    return X, y
+
+
+def test_fit_keeps_best_weights_without_early_stop():
+    rng = np.random.default_rng(0)
+    X, y = classification_data(rng)
+    # the validation labels are flipped, so its loss gets worse as the
+    # model learns, and patience is never reached
+    X_val, y_val = classification_data(rng, 50)
+
+    model = LogisticRegression(random_state=0)
+    model.fit(X, y, learning_rate=0.1, epochs=20, validation_data=(X_val, 1 - y_val),
+              patience=100)
+
+    assert np.argmin(model.validation_losses) < len(model.validation_losses) - 1
+    assert model._dataset_loss(X_val, 1 - y_val) == pytest.approx(model.validation_losses.min())
+
+
+def test_fit_nan_validation_loss_keeps_starting_weights():
+    rng = np.random.default_rng(0)
+    X, y = classification_data(rng)
+    X_val = np.full((10, 4), np.nan)
+
+    model = LogisticRegression(random_state=0)
+    model._rng = None
+    model._init_params(4, 2)
+    weights, bias = model.weights.copy(), model.bias.copy()
+
+    model.fit(X, y, epochs=20, validation_data=(X_val, y[:10]), patience=3)
+
+    assert len(model.validation_losses) == 3
+    np.testing.assert_array_equal(model.weights, weights)
+    np.testing.assert_array_equal(model.bias, bias)
+
+
+@pytest.mark.parametrize('one_hot', [False, True])
+def test_fit_rejects_validation_labels_of_another_format(one_hot):
+    rng = np.random.default_rng(0)
+    X, y = classification_data(rng)
+    X_val, y_val = classification_data(rng, 50)
+    if one_hot:
+        y = np.eye(2)[y]
+    else:
+        y_val = np.eye(2)[y_val]
+
+    model = LogisticRegression(random_state=0)
+    with pytest.raises(ValueError, match="Validation labels"):
+        model.fit(X, y, epochs=2, validation_data=(X_val, y_val))
+    assert model._one_hot is one_hot
@@ -0,0 +1,34 @@
+import pytest
+
+import parallel
+
+from my_av import TRAFFIC_FILE, TrafficScanner
+
+
+def write_traffic(path, repeat=3, stop=False):
+    # the flows of the dataset repeated, so ips learned in a range are seen
+    # again in the next ones
+    with open(TRAFFIC_FILE) as traffic_file:
+        header = traffic_file.readline()
+        packets = [packet for packet in traffic_file.read().splitlines() if packet]
+
+    body = ''.join(f"{packet}\n" for packet in packets * repeat)
+    if stop:
+        body += '\n' + ''.join(f"{packet}\n" for packet in packets)
+    path.write_text(header + body)
+
+
+@pytest.mark.parametrize('stop', [False, True])
+@pytest.mark.parametrize('shard_bytes', [4096, 1 << 26])
+def test_parallel_traffic_matches_sequential(in_base, monkeypatch, tmp_path, shard_bytes, stop):
+    monkeypatch.setattr(parallel, 'SHARD_BYTES', shard_bytes)
+    in_path = tmp_path / 'traffic.in'
+    write_traffic(in_path, stop=stop)
+
+    sequential = TrafficScanner()
+    count = sequential.scan_file(in_path, tmp_path / 'sequential.out')
+
+    sharded = TrafficScanner()
+    assert parallel.scan_traffic_parallel(sharded, in_path, tmp_path / 'parallel.out', 2) == count
+    assert (tmp_path / 'parallel.out').read_bytes() == (tmp_path / 'sequential.out').read_bytes()
+    assert dict(sharded.evil_ips.entries) == dict(sequential.evil_ips.entries)
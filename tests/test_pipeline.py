@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+
+from decision_tree.decision_tree import DecisionTree
+from inference.pipeline import ThreatPipeline
+from logistic_regression.logistic_regression import LogisticRegression
+from preprocessing.utils import IP_FIELDS, IPTransformer, load_network_dataset, network_features
+
+TRAFFIC_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'network_dataset', 'traffic.in')
+
+
+def test_columns_from_any_directory(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    pipeline = ThreatPipeline(DecisionTree())
+
+    assert pipeline.columns[:3] == ['origin_ip', 'origin_port', 'response_ip']
+    assert 'flow_duration' in pipeline.columns
+
+
+def read_records():
+    with open(TRAFFIC_FILE) as traffic_file:
+        traffic_file.readline()
+        return [record for record in traffic_file.read().splitlines() if record]
+
+
+@pytest.fixture
+def dataset(in_base):
+    return load_network_dataset(cache=False)
+
+
+@pytest.mark.parametrize('encoding', ['octets', 'integer', 'prefix'])
+def test_featurize_matches_network_features(dataset, encoding):
+    df, labels = dataset
+    pipeline = ThreatPipeline(DecisionTree(max_depth=2), encoding=encoding).fit(df, labels)
+    expected = network_features(df[pipeline.columns], IPTransformer(IP_FIELDS, encoding).fit(None))
+
+    records = read_records()
+    np.testing.assert_array_equal(pipeline.featurize(records), expected)
+    np.testing.assert_array_equal(pipeline.featurize(''.join(f"{record}\n" for record in records).encode()),
+                                  expected)
+
+
+def test_folded_weights_give_the_same_logits(dataset):
+    df, labels = dataset
+    model = LogisticRegression(random_state=0)
+    pipeline = ThreatPipeline(model, epochs=5, batch_size=64).fit(df, labels)
+
+    X = network_features(df[pipeline.columns], pipeline.ip_transformer)
+    scaled = pipeline.scaler.transform(X)
+    logits = scaled @ model.weights + model.bias
+
+    records = read_records()
+    np.testing.assert_allclose(pipeline.featurize(records) @ pipeline.weights_ + pipeline.bias_,
+                               logits, rtol=1e-9, atol=1e-9)
+    assert pipeline.predict(records).tolist() == pipeline.classes_[model.predict(scaled)].tolist()
+    np.testing.assert_allclose(pipeline.predict_proba(records), model.softmax(logits), atol=1e-12)
@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+from reputation import ReputationStore, ip_key, key_ip
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize('ip', ['10.0.0.1', '::1', '2001:db8::ff', 'not an ip', ''])
+def test_ip_key_round_trip(ip):
+    assert key_ip(ip_key(ip)) == ip
+
+
+def test_ipv4_and_ipv6_keys_differ():
+    assert ip_key('0.0.0.1') != ip_key('::1')
+
+
+def test_ttl_expires_entries():
+    clock = Clock()
+    store = ReputationStore(ttl=10, clock=clock)
+    store.add('10.0.0.1')
+
+    clock.now = 9.5
+    assert '10.0.0.1' in store
+    clock.now = 10
+    assert '10.0.0.1' not in store
+    assert len(store) == 0
+
+
+def test_add_again_extends_ttl():
+    clock = Clock()
+    store = ReputationStore(ttl=10, clock=clock)
+    store.add('10.0.0.1')
+    clock.now = 5
+    store.add('10.0.0.1')
+
+    clock.now = 12
+    store.add('10.0.0.2')
+    assert list(store) == ['10.0.0.1', '10.0.0.2']
+    clock.now = 15
+    assert '10.0.0.1' not in store
+
+
+def test_add_purges_expired_entries():
+    # never looked up, the expired ips must still go away
+    clock = Clock()
+    store = ReputationStore(ttl=1, clock=clock)
+    for i in range(100_000):
+        clock.now = float(i)
+        store.add(key_ip(i))
+
+    assert len(store) == 1
+    assert len(store._expiries) <= 2
+
+
+def test_evict_expired():
+    clock = Clock()
+    store = ReputationStore(ttl=5, clock=clock)
+    store.add('10.0.0.1')
+    clock.now = 3
+    store.add('10.0.0.2')
+
+    clock.now = 6
+    assert store.evict_expired() == 1
+    assert list(store) == ['10.0.0.2']
+
+
+def test_max_size_evicts_least_recently_seen():
+    store = ReputationStore(max_size=2)
+    store.add('10.0.0.1')
+    store.add('10.0.0.2')
+    assert '10.0.0.1' in store
+    store.add('10.0.0.3')
+
+    assert list(store) == ['10.0.0.1', '10.0.0.3']
+
+
+def test_hits():
+    store = ReputationStore()
+    store.add('10.0.0.1')
+    assert '10.0.0.1' in store
+    assert '10.0.0.1' in store
+    assert '10.0.0.2' not in store
+    store.add_hits('10.0.0.1', 3)
+    store.add_hits('10.0.0.2', 3)
+
+    assert store.hits('10.0.0.1') == 5
+    assert store.hits('10.0.0.2') == 0
+    # adding again keeps the hits
+    store.add('10.0.0.1')
+    assert store.hits('10.0.0.1') == 5
+
+
+def test_snapshot_restore(tmp_path):
+    clock = Clock()
+    store = ReputationStore(ttl=10, clock=clock)
+    store.add('10.0.0.1')
+    clock.now = 5
+    store.add('::1')
+    assert '10.0.0.1' in store
+    path = tmp_path / 'evil_ips.json'
+    store.snapshot(path)
+
+    # the first ip expires while the sensor is down
+    clock.now = 12
+    restored = ReputationStore(ttl=10, clock=clock)
+    restored.restore(path)
+
+    assert list(restored) == ['::1']
+    assert restored.entries[ip_key('::1')] == [15, 0]
+    clock.now = 15
+    restored.add('10.0.0.2')
+    assert list(restored) == ['10.0.0.2']
+
+
+def test_restore_keeps_max_size(tmp_path):
+    store = ReputationStore()
+    for i in range(5):
+        store.add(f"10.0.0.{i}")
+    path = tmp_path / 'evil_ips.json'
+    store.snapshot(path)
+
+    restored = ReputationStore(max_size=2)
+    restored.restore(path)
+    assert list(restored) == ['10.0.0.3', '10.0.0.4']
+
+
+def test_restore_rejects_other_versions(tmp_path):
+    path = tmp_path / 'evil_ips.json'
+    path.write_text(json.dumps({'version': 0, 'entries': []}))
+
+    with pytest.raises(ValueError):
+        ReputationStore().restore(path)
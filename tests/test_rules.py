@@ -0,0 +1,32 @@
+import multiprocessing
+import pickle
+
+import parallel
+
+from my_av import URLS_FILE, UrlScanner
+
+
+def read_urls():
+    with open(URLS_FILE) as urls_file:
+        return [url.rstrip() for url in urls_file if url.strip()]
+
+
+def test_url_scanner_pickles(in_base):
+    scanner = UrlScanner()
+    urls = read_urls()
+
+    copy = pickle.loads(pickle.dumps(scanner))
+    assert [copy.explain(url) for url in urls] == [scanner.explain(url) for url in urls]
+
+
+def test_workers_under_spawn(in_base, monkeypatch, tmp_path):
+    # the scanner is sent to the workers, as with the spawn start method
+    monkeypatch.setattr(parallel, 'Pool', multiprocessing.get_context('spawn').Pool)
+    scanner = UrlScanner()
+    out_path = tmp_path / 'urls-predictions.out'
+
+    count = parallel.scan_urls_parallel(scanner, URLS_FILE, out_path, 2)
+
+    predictions = [scanner.scan_url(url) for url in read_urls()]
+    assert count == len(predictions)
+    assert out_path.read_text() == ''.join(f"{malicious}\n" for malicious in predictions)
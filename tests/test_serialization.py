@@ -0,0 +1,127 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.preprocessing import StandardScaler
+
+from decision_tree.decision_tree import DecisionTree
+from decision_tree.random_forest import RandomForest
+from logistic_regression.logistic_regression import LogisticRegression
+from preprocessing.serialization import load_scaler, save_scaler
+from preprocessing.utils import IPTransformer
+
+
+def make_dataset(seed=0, m=200, n=6):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(m, n))
+    y = np.array(['benign', 'bot', 'scan'], dtype=object)[(X[:, 0] + X[:, 1] > 0).astype(int) + (X[:, 2] > 1)]
+    return X, y
+
+
+@pytest.mark.parametrize('one_hot', [False, True])
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_logistic_regression_round_trip(tmp_path, mmap_mode, one_hot):
+    X, y = make_dataset()
+    y = np.unique(y, return_inverse=True)[1]
+    if one_hot:
+        y = np.eye(3)[y]
+
+    model = LogisticRegression(optimizer='adam', random_state=0, dtype=np.float32)
+    model.fit(X, y, epochs=5, verbose=False)
+    model.save(tmp_path / 'model')
+    loaded = LogisticRegression.load(tmp_path / 'model', mmap_mode)
+
+    assert isinstance(loaded.weights, np.memmap) == (mmap_mode == 'r')
+    assert loaded.optimizer == 'adam' and loaded.dtype == np.float32
+    assert loaded._one_hot is one_hot
+    np.testing.assert_array_equal(loaded.weights, model.weights)
+    np.testing.assert_array_equal(loaded.bias, model.bias)
+    np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_decision_tree_round_trip(tmp_path, mmap_mode):
+    X, y = make_dataset()
+
+    tree = DecisionTree(max_depth=4, min_info_gain=0.01, max_bins=16)
+    tree.fit(X, y)
+    tree.save(tmp_path / 'tree')
+    loaded = DecisionTree.load(tmp_path / 'tree', mmap_mode)
+
+    assert loaded.max_bins == 16 and loaded.tree is None
+    for name in ('classes_', 'feature_', 'threshold_', 'left_', 'right_', 'value_'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(tree, name))
+    np.testing.assert_array_equal(loaded.predict(X), tree.predict(X))
+    np.testing.assert_array_equal(loaded.predict_proba(X), tree.predict_proba(X))
+
+
+@pytest.mark.parametrize('voting', ['soft', 'hard'])
+def test_random_forest_round_trip(tmp_path, voting):
+    X, y = make_dataset()
+
+    forest = RandomForest(n_estimators=4, max_depth=3, min_info_gain=0.01, voting=voting,
+                          oob_score=True, random_state=0)
+    forest.fit(X, y)
+    forest.save(tmp_path / 'forest')
+    loaded = RandomForest.load(tmp_path / 'forest')
+
+    assert len(loaded.trees) == 4 and loaded.voting == voting
+    assert loaded.oob_score_ == forest.oob_score_
+    np.testing.assert_array_equal(loaded.classes_, forest.classes_)
+    np.testing.assert_array_equal(loaded.predict(X), forest.predict(X))
+    np.testing.assert_array_equal(loaded.predict_proba(X), forest.predict_proba(X))
+
+
+@pytest.mark.parametrize('frame', [False, True])
+def test_scaler_round_trip(tmp_path, frame):
+    X, y = make_dataset()
+    if frame:
+        X = pd.DataFrame(X, columns=[f"f{i}" for i in range(X.shape[1])])
+
+    scaler = StandardScaler().fit(X)
+    save_scaler(scaler, tmp_path / 'scaler')
+    loaded = load_scaler(tmp_path / 'scaler')
+
+    assert loaded.n_samples_seen_ == scaler.n_samples_seen_
+    np.testing.assert_array_equal(loaded.mean_, scaler.mean_)
+    np.testing.assert_array_equal(loaded.scale_, scaler.scale_)
+    np.testing.assert_array_equal(loaded.transform(X), scaler.transform(X))
+    if frame:
+        np.testing.assert_array_equal(loaded.feature_names_in_, scaler.feature_names_in_)
+
+
+@pytest.mark.parametrize('encoding', IPTransformer.ENCODINGS)
+def test_ip_transformer_round_trip(tmp_path, encoding):
+    df = pd.DataFrame({'origin_ip': ['10.0.0.1', 'fe80::1', None],
+                       'response_ip': ['192.168.1.20', '8.8.8.8', '1.2.3.4'],
+                       'port': [80, 443, 53]})
+
+    transformer = IPTransformer(['origin_ip', 'response_ip'], encoding).fit(df)
+    transformer.save(tmp_path / 'ips')
+    loaded = IPTransformer.load(tmp_path / 'ips')
+
+    assert loaded.get_params() == transformer.get_params()
+    pd.testing.assert_frame_equal(loaded.transform(df), transformer.transform(df))
+
+
+def test_load_checks_kind_and_version(tmp_path):
+    X, y = make_dataset()
+    tree = DecisionTree(max_depth=2)
+    tree.fit(X, y)
+    tree.save(tmp_path / 'tree')
+
+    with pytest.raises(ValueError, match="not a LogisticRegression"):
+        LogisticRegression.load(tmp_path / 'tree')
+
+    meta_path = os.path.join(tmp_path, 'tree', 'meta.json')
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    meta['version'] += 1
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+    with pytest.raises(ValueError, match="version"):
+        DecisionTree.load(tmp_path / 'tree')
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.utils import IP_FIELDS, IPTransformer, iter_network_dataset, \
+    load_network_dataset, network_features, pack_ipv4
+
+
+@pytest.mark.parametrize('encoding', ['octets', 'integer', 'prefix'])
+def test_chunks_match_network_features(in_base, encoding):
+    df, labels = load_network_dataset(cache=False)
+    expected = network_features(df, IPTransformer(IP_FIELDS, encoding).fit(None))
+
+    chunks = list(iter_network_dataset(chunk_size=300, encoding=encoding))
+    assert [len(X) for X, y in chunks] == [300, 300, 300, 100]
+    assert all(X.dtype == np.float64 for X, y in chunks)
+
+    np.testing.assert_array_equal(np.concatenate([X for X, y in chunks]), expected)
+    assert np.concatenate([y for X, y in chunks]).tolist() == labels
+
+
+def test_labels_as_class_indices(in_base):
+    df, labels = load_network_dataset(cache=False)
+    classes = sorted(set(labels))
+
+    y = np.concatenate([y for X, y in iter_network_dataset(chunk_size=300, classes=classes)])
+    assert y.dtype == np.int16
+    assert [classes[i] for i in y] == labels
+
+
+def test_integer_columns_are_downcast(in_base):
+    columns = ['origin_ip', 'origin_port', 'fwd_pkts_tot', 'response_ip']
+    df, labels = load_network_dataset(columns, cache=False)
+    expected = network_features(df, IPTransformer(IP_FIELDS).fit(None))
+
+    chunks = list(iter_network_dataset(chunk_size=300, columns=columns))
+    # the ports need more than an int16
+    assert all(X.dtype == np.int32 for X, y in chunks)
+    np.testing.assert_array_equal(np.concatenate([X for X, y in chunks]), expected)
+
+
+def test_explicit_dtype(in_base):
+    X, y = next(iter_network_dataset(chunk_size=300, dtype=np.float32))
+    assert X.dtype == np.float32
+
+
+def test_pack_ipv4():
+    ips = ['10.0.0.1', '::1', None, '255.255.255.255', np.nan, '10.0.0.1']
+    expected = [10 << 24 | 1, 0, 0, 2 ** 32 - 1, 0, 10 << 24 | 1]
+    assert pack_ipv4(ips).tolist() == expected
+    assert pack_ipv4(pd.Series(ips, dtype='string')).tolist() == expected
+
+
+@pytest.mark.parametrize('ip', ['1.2.3', '1.2.3.256'])
+def test_pack_ipv4_rejects_invalid(ip):
+    with pytest.raises(ValueError):
+        pack_ipv4([ip])
+
+
+def test_ip_transformer_keeps_input():
+    df = pd.DataFrame({'origin_ip': ['10.1.2.3', None, 'fe80::1'], 'port': [1, 2, 3]})
+    copy = df.copy()
+
+    encoded = IPTransformer(['origin_ip']).fit(df).transform(df)
+    pd.testing.assert_frame_equal(df, copy)
+    assert encoded.columns.tolist() == ['port', 'origin_ip_ipv6'] + [f"origin_ip_{i}" for i in range(4)]
+    assert encoded['origin_ip_ipv6'].tolist() == [0, 0, 1]
+    assert encoded['origin_ip_1'].tolist() == [1, 0, 0]